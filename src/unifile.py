@@ -1,7 +1,26 @@
 import argparse
+import base64
+import codecs
+import difflib
+import concurrent.futures
+import ctypes
+import hashlib
+import heapq
+import json
+import multiprocessing
 import os
+import queue
 import sys
 import re
+import select
+import sqlite3
+import stat
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
 
 try:
     from editorconfig import get_properties, EditorConfigError
@@ -10,9 +29,44 @@ except Exception as e:
     print("Failed to import editorconfig module, '.editorconfig' files would be ignored", file=sys.stderr)
     E_CONF = None
 
+E_CONF_INTERNALS = None
+if E_CONF is not None:
+    try:
+        from editorconfig.handler import EditorConfigHandler
+        from editorconfig.ini import EditorConfigParser
+        E_CONF_INTERNALS = (EditorConfigHandler, EditorConfigParser)
+    except Exception as e:
+        pass
 
-VERSION = "1.3a.0"
+
+VERSION = "1.4a.0"
 VERSION_HISTORY = {
+    "1.4a.0": {
+        "Release Notes": "Parallel processing of folders (`--jobs`)."
+                         " Unchanged files aren't rewritten, changed files are replaced atomically."
+                         " Persistent cache of well formatted files (`--cache`)."
+                         " Each '.editorconfig' file is parsed only once per run."
+                         " Faster whitespaces processing."
+                         " Large files are processed with bounded memory."
+                         " Processing stats (`--stats`, `--profile-json`)."
+                         " Faster realign, alignment of columns within blocks of lines (`--realign-columns`)."
+                         " Excluded folders aren't walked, '.gitignore'-like files support (`--ignore-file`)."
+                         " Faster decoding, only lines that aren't valid for the first encoding are decoded one by one."
+                         " Binary files are skipped (`--no-binary-check`, `--max-size`)."
+                         " Processing of files changed according to git (`--changed-since`, `--staged`)."
+                         " Watch mode (`--watch`)."
+                         " In-memory formatting (`format_bytes`) and formatting server (`--server`)."
+                         " `--suggest-config` is implemented, `--suggest-sample` to infer config from heads of files."
+                         " Pipelined I/O for single process (`--io-depth`)."
+                         " Check and diff modes for CI (`--check`, `--diff`)."
+                         " Content of ASCII-compatible encodings is formatted without decoding when possible."
+                         " Processing of listed files (`--files-from`, `-0`), JSON record per file (`--jsonl`)."
+                         " Sharding of files between machines (`--shard`) and merging of reports (`merge-reports`)",
+        "Breaking changes": [
+            "Processing of folder doesn't stops on first failed file anymore."
+            " Errors are reported in the end of run and exit code is non-zero",
+        ],
+    },
     "1.3a.0": {
         "Release Notes": "Per line encoding",
     },
@@ -41,6 +95,11 @@ VERSION_HISTORY = {
 
 ENCODINGS = ('utf-8', ) # Fallback encodings if nothing is specified
 _LE = {'lf' : '\n', 'crlf'  : '\r\n', 'cr' : '\r', }
+STREAM_THRESHOLD = 64 << 20 # Files larger than this are processed without loading into memory
+REALIGN_COLUMNS = 'columns' # Realign mode to align columns of chunks within blocks of adjacent lines
+SNIFF_SIZE = 8 << 10        # Size of file's head to check whether file is binary
+PREFETCH_SIZE = 4 << 20     # Files larger than this aren't read in advance
+WRITE_BEHIND_SIZE = 64 << 20 # Max total size of results that are waiting to be written
 
 
 def fix_spaces(line, tab_width, trim):
@@ -62,6 +121,9 @@ def fix_spaces(line, tab_width, trim):
         else:
             t = tab_width - (pos + len(spaces)) % tab_width
             spaces += " " * t
+    if not trim:
+        # End of string is treated as end of line
+        result += spaces
     return result
 
 
@@ -88,7 +150,7 @@ def fix_tabs(line, tab_width, trim):
             result += line[i]
             pos += 1
         else:
-            if spaces == "" and tabs == "" and line[i+1] not in (" ", "\t", "\r", "\n"):
+            if spaces == "" and tabs == "" and i+1 < len(line) and line[i+1] not in (" ", "\t", "\r", "\n"):
                 # Single space in between - just post it
                 result += " "
                 pos += 1
@@ -99,247 +161,442 @@ def fix_tabs(line, tab_width, trim):
                 tabs += "\t"
                 pos += len(spaces)
                 spaces = ""
+    if not trim:
+        # End of string is treated as end of line
+        result += tabs + spaces
     return result
 
 
-def realign_text(line, use_tabs, tab_width):
-    chunks_map = []
-    spaces = 0
-    space_chars = 0
-    tabs = False
-    pos = 0
+# Fast versions of fix_spaces and fix_tabs. They give exactly the same result, but rely on bulk str operations
+# instead of char by char processing. fix_spaces and fix_tabs are kept as reference implementation
 
-    # Detect chunks of text
-    for i in range(0, len(line)):
-        if line[i] == "\t":
-            tabs = True
-            spaces += tab_width - pos % tab_width
-            pos += tab_width - pos % tab_width
-            space_chars += 1
-        elif line[i] == " ":
-            spaces += 1
-            pos += 1
-            space_chars += 1
+_WS_RUN = re.compile(r'[ \t]+')
+_WS_SPLIT = re.compile(r'([ \t]+)')
+
+
+def _fix_spaces_fast(line, tab_width, trim):
+    if "\r" in line or "\n" in line:
+        return fix_spaces(line, tab_width, trim)
+    if "\t" in line:
+        line = line.expandtabs(tab_width)
+    if trim:
+        return line.rstrip(" ")
+    return line
+
+
+def _fix_tabs_fast(line, tab_width, trim):
+    if "\r" in line or "\n" in line:
+        return fix_tabs(line, tab_width, trim)
+    if "\t" not in line and "  " not in line and line[-1:] != " ":
+        # Nothing but single spaces in between
+        return line
+    rest = line.lstrip("\t")
+    if rest and rest[0] != " " and rest[-1] != " " and "\t" not in rest and "  " not in rest:
+        # Leading tabs are kept as is, and nothing but single spaces in between after them
+        return line
+
+    result = []
+    n = len(line)
+    prev = 0    # End of line's part that is already in result
+    i = 0       # Position within line ...
+    col = 0     # ... and it's display position
+    for m in _WS_RUN.finditer(line):
+        start, end = m.span()
+        col += start - i
+        i = end
+        if end == n and trim:
+            result.append(line[prev:start])
+            prev = end
+            break
+        run = m.group()
+        if end < n and run == " ":
+            # Single space in between - leave it as is
+            col += 1
+            continue
+        # Display position after whitespaces
+        c = col
+        if "\t" in run:
+            parts = run.split("\t")
+            for part in parts[:-1]:
+                c = ((c + len(part)) // tab_width + 1) * tab_width
+            c += len(parts[-1])
         else:
-            if tabs or len(chunks_map) == 0 or spaces >= tab_width:
-                if len(chunks_map) > 0:     # TODO: try to increase threshold ?
-                    prev_chunk_length = i - space_chars - chunks_map[-1]['origin']
-                    chunks_map[-1]['after']  = spaces
-                    chunks_map[-1]['value']  = line[
-                        chunks_map[-1]['origin'] :
-                        chunks_map[-1]['origin'] + prev_chunk_length
-                    ]
-                chunks_map.append({
-                    # NOTE: some of those fields are only to check under debug that things works properly
-                    'origin': i,            # Chunk start within line
-                    'size'  : None,         # Chunk size in display chars (where size of tab char == tab_width)
-                    'before': spaces,       # Display whitespaces before chunk
-                    'after' : 0,            # Display whitespaces after chunk
-                    'target': pos,          # Chunk start within result in display chars
-                    'move_right': False,    # Chunk should be moved to the right
-                    'value' : None          # All chunk's line chars
-                })
-            spaces = 0
-            space_chars = 0
-            tabs = False
-            pos += 1
+            c += len(run)
+        tabs = c // tab_width - col // tab_width
+        if tabs > 0:
+            ws = "\t" * tabs + " " * (c % tab_width)
+        else:
+            ws = " " * (c - col)
+        result.append(line[prev:start])
+        result.append(ws)
+        prev = end
+        col = c
+    result.append(line[prev:])
+    return "".join(result)
 
-    assert len(chunks_map) != 0, "Something went wrong" # NOTE: every line should contain at least EOL sequence
-                                                        #       so chunks map can't be empty
-    assert spaces == 0, "Something went wrong"          # NOTE: at this stage only chunk with EOL sequence can be,
-    assert space_chars == 0, "Something went wrong"     #       so spaces and space_chars should be 0
-
-    chunks_map[-1]['value']  = line[chunks_map[-1]['origin'] : ]
-
-    # Calculate chunks sizes:
-    for chunk in chunks_map:
-        chunk['size'] = 0
-        for char in chunk['value']:
-            if char == '\t':
-                # NOTE: tab always splits text into chunks, but in case if this behavior would change,
-                # following code should be used
-                chunk['size'] += tab_width - chunk['size'] % tab_width
-            else:
-                chunk['size'] += 1
-
-    # Align chunks
-    for i in range(0, len(chunks_map)):
-        prev_chunk = None
-        next_chunk = None
-        realign = False
-        chunk = chunks_map[i]
+
+class _LineChunks:
+    """Chunks of text within line: values, their sizes and targets in display chars (where size of tab char == tab_width).
+    Sizes are equal to lengths of values since tab char always splits text into chunks"""
+    __slots__ = ('values', 'sizes', 'targets')
+
+    def __init__(self, line, tab_width):
+        text = line.lstrip(" \t")
+        if "\t" not in text and " " * tab_width not in text:
+            # NOTE: the most of lines contain only indent and single chunk
+            self.values = [text]
+            self.sizes = [len(text)]
+            self.targets = [len(line[:len(line) - len(text)].expandtabs(tab_width))]
+            return
+        # NOTE: parts are text, whitespaces, text, ..., whitespaces, text
+        parts = _WS_SPLIT.split(line)
+        values = []
+        targets = []
+        i = len(parts[0])   # Position within line ...
+        pos = i             # ... and it's display position
+        origin = 0          # Chunk start within line
         if i > 0:
-            prev_chunk = chunks_map[i-1]
-        if i < len(chunks_map)-1:
-            next_chunk = chunks_map[i+1]
-        pos = chunk['target']   # Current chunk's position on display
-        offs = pos % tab_width  # Chunk's misalignment
-        realign = offs != 0
-        if prev_chunk is None:
-            # It's safe and reasonable to move first chunk to the left
-            if  realign:
-                chunk['target'] = pos - offs
-        else:
-            # Try to move left if unaligned. Leave at least 'tab_width' spaces from each side
-            if realign:
-                if not chunk['move_right']:
-                    t = pos - offs
-                    if t - prev_chunk['target'] < tab_width + prev_chunk['size']:
-                        chunk['move_right'] = True
-                    else:
-                        chunk['target'] = t
-
-            # If need to move right then do it
-            if chunk['move_right']:
-                t = (prev_chunk['target'] + prev_chunk['size'] + tab_width + tab_width-1) // tab_width * tab_width
-                if t >= chunk['target']:
-                    chunk['target'] = t
-                else:
-                    if offs > 0:
-                        assert False, "Something went wrong"    # TODO: probably we shouldn't be here at all
-                        chunk['target'] = pos + tab_width - offs
+            targets.append(0)
+        for k in range(1, len(parts), 2):
+            ws = parts[k]
+            start = i
+            i += len(ws)
+            if "\t" in ws:
+                offs = pos % tab_width
+                pos += len((" " * offs + ws).expandtabs(tab_width)) - offs
+            elif len(ws) >= tab_width or len(targets) == 0:     # TODO: try to increase threshold ?
+                pos += len(ws)
+            else:
+                # Whitespaces within chunk
+                pos += len(ws) + len(parts[k+1])
+                i += len(parts[k+1])
+                continue
+            # NOTE: end of line is treated as non-whitespace char,
+            #       so trailing whitespaces are represented by chunk with empty value
+            if len(targets) > 0:
+                values.append(line[origin:start])
+            targets.append(pos)
+            origin = i
+            pos += len(parts[k+1])
+            i += len(parts[k+1])
+        if len(targets) == 0:
+            targets.append(0)
+        values.append(line[origin:])
+        self.values = values
+        self.sizes = [len(v) for v in values]
+        self.targets = targets
 
+    def align(self, tab_width):
+        """Moves chunks to tab-stops: to the left if it leaves at least 'tab_width' spaces from each side,
+        otherwise to the right"""
+        sizes = self.sizes
+        targets = self.targets
+        pos = targets[0]
+        targets[0] = pos - pos % tab_width     # It's safe and reasonable to move first chunk to the left
+        move_right = False
+        last = len(targets) - 1
+        for i in range(1, len(targets)):
+            pos = targets[i]
+            offs = pos % tab_width
+            if offs != 0 and not move_right:
+                t = pos - offs
+                if t - targets[i-1] < tab_width + sizes[i-1]:
+                    move_right = True
+                else:
+                    targets[i] = t
+            next_move_right = False
+            if move_right:
+                t = (targets[i-1] + sizes[i-1] + tab_width + tab_width-1) // tab_width * tab_width
+                if t >= pos:
+                    targets[i] = t
+                elif offs > 0:
+                    t = pos + tab_width - offs
+                    targets[i] = t
                 # Check if it's required to move next chunk to the right
-                if next_chunk is not None:
-                    if (t + chunk['size'] + tab_width + tab_width-1) // tab_width * tab_width < next_chunk['target']:
-                        next_chunk['move_right'] = True
+                if i < last and (t + sizes[i] + tab_width + tab_width-1) // tab_width * tab_width < targets[i+1]:
+                    next_move_right = True
+            move_right = next_move_right
+        return self
 
+    def render(self, use_tabs, tab_width, targets=None):
+        """Puts chunks into resulting string"""
+        if targets is None:
+            targets = self.targets
+        result = []
+        pos = 0
+        for value, size, target in zip(self.values, self.sizes, targets):
+            if target < pos:
+                # NOTE: chunks must not overlap or stick together
+                target = (pos + tab_width) // tab_width * tab_width
+            if target > pos:
+                if use_tabs:
+                    result.append("\t" * (target // tab_width - pos // tab_width))
+                else:
+                    result.append(" " * (target - pos))
+            result.append(value)
+            pos = target + size
+        return "".join(result)
 
-    # Put chunks into resulting string
-    result = ""
-    pos = 0
-    for chunk in chunks_map:
-        assert chunk['target'] >= pos, "Something went wrong"
-        while pos < chunk['target']:
-            if use_tabs:
-                result += "\t"
-                pos += tab_width - pos % tab_width
-            else:
-                dp = (chunk['target'] - pos)
-                result += " " * dp
-                pos += dp
-        assert chunk['target'] == pos, "Something went wrong"
-        result += chunk['value']
-        pos += chunk['size']    # It's OK to do like this since sizes were calculated for aligned chunks
 
-    return result
+def realign_text(line, use_tabs, tab_width):
+    """Realigns text so its chunks (separated by tabs or at least 'tab_width' spaces) start on tab-stops"""
+    return _LineChunks(line, tab_width).align(tab_width).render(use_tabs, tab_width)
 
 
-def fix_indents_in_file(
-        file_path, output_path=None,
-        encodings=None, tab_width=None, use_tabs=None, trim=None, line_endings=None, realign=False, all_files=False):
-    lines = None
-    last_error = None
-    encoding = None
-    suggest = {}
-    line_break = None
-    no_last_line_break = False
+class _ColumnAligner:
+    """Aligns columns of chunks within blocks of adjacent lines with the same indent and number of chunks.
+    Each line is realigned by itself first, then column start is the max over block of line's chunk starts
+    shifted by previous columns moves. Memory is bounded by window: when block is longer than window,
+    the first lines are put out and their columns are kept as the minimum for the rest of block"""
 
-    if not os.path.exists(file_path):
-        raise ValueError(f"File '{file_path}' not found!")
-    elif not os.path.isfile(file_path):
-        raise ValueError(f"Path '{file_path}' should point to file!")
+    def __init__(self, use_tabs, tab_width, window=1024):
+        self.use_tabs = use_tabs
+        self.tab_width = tab_width
+        self.window = window
+        self.block = []         # _LineChunks of current block
+        self.columns = None     # Columns of already put out part of current block
 
-    if E_CONF is not None:
-        try:
-            options = E_CONF[0](file_path)
-        except E_CONF[1]:
-            options = {}
-    else:
-        options = {}
+    def feed(self, lines):
+        """Returns list of realigned lines that are ready to be put out"""
+        result = []
+        for l in lines:
+            chunks = _LineChunks(l, self.tab_width).align(self.tab_width)
+            if len(self.block) > 0:
+                first = self.block[0]
+                if len(chunks.targets) != len(first.targets) or chunks.targets[0] != first.targets[0]:
+                    self._flush(result)
+                    self.columns = None
+                elif len(self.block) >= self.window:
+                    self._flush(result)
+            if len(chunks.targets) < 2:
+                result.append(chunks.render(self.use_tabs, self.tab_width))
+                continue
+            self.block.append(chunks)
+        return result
 
-    if E_CONF is not None and not all_files and len(options) == 0:
-        return suggest
+    def finish(self):
+        """Returns the rest of realigned lines"""
+        result = []
+        self._flush(result)
+        self.columns = None
+        return result
 
-    if 'charset' in options:
-        encoding = options['charset']
-        if encodings is None:
-            encodings = ENCODINGS
-        encodings = (encoding, *encodings)
+    def _flush(self, result):
+        if len(self.block) == 0:
+            return
+        columns = list(self.block[0].targets)
+        if self.columns is not None:
+            columns = [max(c, p) for c, p in zip(columns, self.columns)]
+        for i in range(1, len(columns)):
+            for chunks in self.block:
+                t = columns[i-1] + chunks.targets[i] - chunks.targets[i-1]
+                if t > columns[i]:
+                    columns[i] = t
+        for chunks in self.block:
+            result.append(chunks.render(self.use_tabs, self.tab_width, columns))
+        self.block = []
+        self.columns = columns
 
-    if encodings is None:
-        encodings = ENCODINGS
 
-    encoding_index = None
+def _detect_line_break(fb):
+    """Returns the first found of CRLF, LF, CR within fb or None"""
+    for lb in (b'\r\n', b'\n', b'\r'):
+        if lb in fb:
+            return lb
+    return None
+
 
-    for i in range(0, 1):
-        f = None
+def _decode_lines(raw_lines, encodings):
+    """Decodes lines one by one, since some times there are mixed encodings within file %).
+    Each line is decoded with the first suitable encoding. Yields (line, encoding index)"""
+    for line_raw in raw_lines:
+        last_error = None
+        for eid in range(0, len(encodings)):
+            try:
+                yield line_raw.decode(encodings[eid]), eid
+                break
+            except Exception as e:
+                last_error = e
+        else:
+            raise last_error
+
+
+def _decode_line_list(raw_lines, encodings, counts=None):
+    """Returns (lines, encoding_index), where encoding_index is the max index of used encodings
+    (it's assumed that most specific encodings are in the end of list).
+    In case if there is no output encoding specification then most specific encoding would be used for result.
+    If counts list is specified, then number of lines decoded with each encoding is added to it"""
+    lines = []
+    encoding_index = 0
+    for line, eid in _decode_lines(raw_lines, encodings):
+        if eid > encoding_index:
+            encoding_index = eid
+        if counts is not None:
+            counts[eid] += 1
+        lines.append(line)
+    return lines, encoding_index
+
+
+_ALL_BYTES = bytes(range(256))
+_UNDECODED = re.compile('[\udc80-\udcff]')   # Bytes that are left undecoded by 'surrogateescape' handler
+_BULK_DECODABLE = {}
+
+
+def _bulk_decodable(encoding):
+    """Returns True if content may be decoded at once and then split into lines with the same result
+    as decoding it line by line, i.e. encoding is stateless, ASCII-compatible and each byte is decoded
+    into single char or left undecoded (utf-8 and single byte encodings like windows-1251, latin-1)"""
+    if encoding not in _BULK_DECODABLE:
         try:
-            f = open(file_path, "rb")
-            # Per line decoding since some times there are mixed encodings within file %)
-            fb = f.read()
-            lines = None
-            for lb in (b'\r\n', b'\n', b'\r'):
-                if lb in fb:
-                    line_break = lb.decode()
-                    break
+            name = codecs.lookup(encoding).name
+            decoded = _ALL_BYTES.decode(encoding, 'surrogateescape')
+            _BULK_DECODABLE[encoding] = name not in ('utf-8-sig', 'utf-7') and len(decoded) == 256 \
+                and decoded[:128] == _ALL_BYTES[:128].decode('ascii') \
+                and decoded.encode(encoding, 'surrogateescape') == _ALL_BYTES
+        except (LookupError, UnicodeError):
+            _BULK_DECODABLE[encoding] = False
+    return _BULK_DECODABLE[encoding]
 
-            if line_break is None:
-                line_break = b'\n'
 
-            fb_left = fb
-            lines = []
-            while True:
-                line = None
+def _decode_buffer(fb, lb, encodings, counts=None):
+    """Splits raw content by line break lb (if it's not None) and decodes lines same as _decode_line_list does.
+    If the first encoding allows, whole content is decoded at once, and only lines with bytes that are not valid
+    for it are decoded line by line with the rest of encodings"""
+    if not _bulk_decodable(encodings[0]):
+        return _decode_line_list([fb] if lb is None else fb.split(lb), encodings, counts)
+    text = fb.decode(encodings[0], 'surrogateescape')
+    if lb is None:
+        lines = [text]
+    else:
+        lb = lb.decode()
+        lines = text.split(lb)
+    encoding_index = 0
+    fallback = 0
+    m = _UNDECODED.search(text)
+    i = 0       # Index of line ...
+    start = 0   # ... and it's start within text
+    while m is not None:
+        if lb is not None:
+            i += text.count(lb, start, m.start())
+            if fallback >= 16 and fallback * 4 > i:
+                # NOTE: most of lines are not valid for the first encoding, it's cheaper to decode the rest line by line
+                rest, rest_encoding_index = _decode_line_list(fb.split(lb.encode())[i:], encodings, counts)
+                if counts is not None:
+                    counts[0] += i - fallback
+                return lines[:i] + rest, max(encoding_index, rest_encoding_index)
+        line, eid = next(_decode_lines([lines[i].encode(encodings[0], 'surrogateescape')], encodings))
+        lines[i] = line
+        if eid > encoding_index:
+            encoding_index = eid
+        if counts is not None:
+            counts[eid] += 1
+        fallback += 1
+        start = -1 if lb is None else text.find(lb, m.end())
+        if start < 0:
+            break
+        m = _UNDECODED.search(text, start)
+    if counts is not None:
+        counts[0] += len(lines) - fallback
+    return lines, encoding_index
 
-                try:
-                    next_lb = fb_left.index(lb)
-                    line_raw = fb_left[:next_lb]
-                    fb_left = fb_left[next_lb + len(lb):]
-                except Exception as e:
-                    line_raw = fb_left
-                    fb_left = None
-                    no_last_line_break = True
 
-                for eid in range(0, len(encodings)):
-                    try:
-                        line = line_raw.decode(encodings[eid])
-                        if encoding_index is None or eid > encoding_index:
-                            # Store encoding with max id (it's assumed that most specific encodings are in the end of list)
-                            # In case if there is no output encoding specification then most specific encoding would be used
-                            # for result
-                            encoding_index = eid
-                        break
-                    except Exception as e:
-                        last_error = e
-
-                if line is None:
-                    raise e
-
-                lines.append(line + "\n")
-                if fb_left is None or len(fb_left) == 0:
-                    break
+def _read_lines(fb, encodings, counts=None):
+    """Decodes raw file content line by line.
+    Returns (lines, encoding_index, line_break, no_last_line_break), where line_break is the first found
+    of CRLF, LF, CR and lines are without line breaks"""
+    lb = _detect_line_break(fb)
+    lines, encoding_index = _decode_buffer(fb, lb, encodings, counts)
+    if lb is None:
+        return lines, encoding_index, '\n', True
+    if len(lines) > 1 and len(lines[-1]) == 0:
+        lines.pop()
+        if counts is not None:
+            counts[0] -= 1
+        return lines, encoding_index, lb.decode(), False
+    return lines, encoding_index, lb.decode(), True
 
-            f.close()
-            if encoding is None:
-                if encoding_index is not None:
-                    encoding = encodings[encoding_index]
-                    suggest['charset'] = encoding
-                else:
-                    encoding = encodings[0]
-        except Exception as e:
-            if f is not None:
-                f.close()
-            last_error = e
+
+def _indent_counts(lines, tab="\t", space=" "):
+    """Returns numbers of lines that are starting with tab and with space (lines may be raw if tab and space are)"""
+    tabs = 0
+    spaces = 0
+    for l in lines:
+        if l[:1] == tab:
+            tabs += 1
+            continue
+        if l[:1] == space:
+            spaces += 1
+    return tabs, spaces
+
+
+def _observe(lines, line_break, encoding):
+    """Returns '.editorconfig' properties observed within lines of file: indent style (majority of indented lines),
+    indent size (the most common increase of spaces indent between adjacent lines), charset, end of line
+    and whether trailing whitespaces are trimmed"""
+    tabs = 0
+    spaces = 0
+    trailing = 0
+    text_lines = 0
+    steps = {}
+    prev = 0
+    for l in lines:
+        text = l.lstrip(" \t")
+        if len(text) == 0:
+            if len(l) > 0:
+                trailing += 1
+            continue
+        text_lines += 1
+        if text[-1] in " \t":
+            trailing += 1
+        c = l[:1]
+        if c == "\t":
+            tabs += 1
             continue
-        break
+        indent = len(l) - len(text)
+        if c == " ":
+            spaces += 1
+            if "\t" in l[:indent]:
+                continue
+        if indent > prev:
+            steps[indent - prev] = steps.get(indent - prev, 0) + 1
+        prev = indent
+    observed = {
+        'charset': encoding,
+        # NOTE: few lines with trailing whitespaces are likely accidental
+        'trim_trailing_whitespace': ['true', 'false'][trailing * 10 > max(text_lines, 1)],
+    }
+    if line_break is not None:
+        observed['end_of_line'] = {v: k for k, v in _LE.items()}[line_break]
+    if tabs > 0 or spaces > 0:
+        observed['indent_style'] = ['space', 'tab'][tabs > spaces]
+        if tabs <= spaces and len(steps) > 0:
+            observed['indent_size'] = str(min(steps, key=lambda step: (-steps[step], step)))
+    return observed
+
 
-    if lines is None:
-        raise last_error
+def _observe_file(f, encodings, size):
+    """Same as _observe for the first size bytes of file (cut at the last line break).
+    Returns None if content looks like binary"""
+    head = f.read(size)
+    if _is_binary(head, encodings):
+        return None
+    lb = _detect_line_break(head)
+    if lb is not None and len(f.read(1)) > 0:
+        head = head[:head.rfind(lb)]
+    lines, encoding_index, _, _ = _read_lines(head, encodings)
+    return _observe(lines, None if lb is None else lb.decode(), encodings[encoding_index])
 
+
+def _resolve_format(options, indent_counts, use_tabs, tab_width, trim, line_endings, suggest):
+    """Resolves format options that are not specified explicitly from '.editorconfig' properties or fallbacks.
+    indent_counts is called to get numbers of lines starting with tab and with space if indentation isn't specified.
+    Returns (use_tabs, tab_width, trim, line_endings)"""
     if use_tabs is None:
         if 'indent_style' in options:
             use_tabs = options['indent_style'] == 'tab'
 
     if use_tabs is None:
-        tabs = 0
-        spaces = 0
-        for l in lines:
-            if l[:1] == "\t":
-                tabs += 1
-                continue
-            if l[:1] == " ":
-                spaces += 1
+        tabs, spaces = indent_counts()
         use_tabs = tabs > spaces
         suggest['indent_style'] = ('space', 'tab')[use_tabs]
 
@@ -367,128 +624,2172 @@ def fix_indents_in_file(
     if line_endings is not None:
         line_endings = _LE[line_endings]
 
-    result = []
+    return use_tabs, tab_width, trim, line_endings
+
+
+def _format_lines(lines, use_tabs, tab_width, trim, realign, stats=None, aligner=None):
+    """Returns iterable of formatted lines.
+    If stats are collected, then lines are processed phase by phase to measure time of each phase.
+    In case of REALIGN_COLUMNS lines are fed into aligner (_ColumnAligner) and only lines which are ready
+    are returned, the rest is returned by aligner.finish(). If aligner isn't specified, all lines are returned"""
+    fix = [_fix_spaces_fast, _fix_tabs_fast][use_tabs]
+    if realign == REALIGN_COLUMNS:
+        finish = aligner is None
+        if finish:
+            aligner = _ColumnAligner(use_tabs, tab_width)
+        if stats is not None:
+            t = time.perf_counter()
+        result = aligner.feed(fix(l, tab_width, trim) for l in lines)
+        if finish:
+            result.extend(aligner.finish())
+        if stats is not None:
+            stats.phase('realign', t)
+        return result
+    if stats is None:
+        return _iter_format_lines(lines, fix, use_tabs, tab_width, trim, realign)
+    t = time.perf_counter()
+    result = [fix(l, tab_width, trim) for l in lines]
+    t = stats.phase('fix', t)
+    if realign:
+        result = [_LineChunks(l, tab_width).align(tab_width).render(use_tabs, tab_width) for l in result]
+        stats.phase('realign', t)
+    return result
+
+
+def _iter_format_lines(lines, fix, use_tabs, tab_width, trim, realign):
     for l in lines:
-        if use_tabs:
-            o_l = fix_tabs(l, tab_width, trim)
+        o_l = fix(l, tab_width, trim)
+        if realign:
+            o_l = _LineChunks(o_l, tab_width).align(tab_width).render(use_tabs, tab_width)
+        yield o_l
+
+
+class _AtomicFile:
+    """Temporary file next to path, which replaces path on commit,
+    so interrupted write never leaves truncated file behind.
+    Permissions are taken from existing path, or from mode_path for new files"""
+
+    def __init__(self, path, mode_path=None):
+        # NOTE: symlink is resolved, so its target is replaced and the link itself stays in place
+        self.path = os.path.realpath(path)
+        self.mode_path = mode_path
+        directory, name = os.path.split(self.path)
+        fd, self.tmp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory)
+        self._f = os.fdopen(fd, "wb", buffering=1 << 20)
+
+    def write(self, data):
+        self._f.write(data)
+
+    def commit(self):
+        try:
+            self._f.flush()
+            os.fsync(self._f.fileno())
+            self._f.close()
+            for mp in (self.path, self.mode_path):
+                if mp is not None and os.path.exists(mp):
+                    os.chmod(self.tmp_path, stat.S_IMODE(os.stat(mp).st_mode))
+                    break
+            else:
+                umask = os.umask(0)
+                os.umask(umask)
+                os.chmod(self.tmp_path, 0o666 & ~umask)
+            os.replace(self.tmp_path, self.path)
+        except BaseException:
+            self.discard()
+            raise
+
+    def discard(self):
+        self._f.close()
+        if os.path.exists(self.tmp_path):
+            os.unlink(self.tmp_path)
+
+
+class _Stats:
+    """Cumulative time of processing phases, throughput counters, numbers of lines decoded with each encoding
+    and the slowest files. Stats collected by worker processes are merged as dicts"""
+
+    def __init__(self, top=10):
+        self.top = top
+        self.phases = {}
+        self.counters = {}
+        self.encoding_index = {}    # Index within list of encodings -> number of lines
+        self.encodings = {}         # Encoding -> number of lines
+        self.slowest = []           # Heap of (seconds, file path)
+
+    def phase(self, name, t):
+        """Adds time since t to phase and returns current time"""
+        now = time.perf_counter()
+        self.phases[name] = self.phases.get(name, 0.0) + now - t
+        return now
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def count_encodings(self, encodings, counts):
+        for eid, n in enumerate(counts):
+            if n > 0:
+                self.encoding_index[eid] = self.encoding_index.get(eid, 0) + n
+                self.encodings[encodings[eid]] = self.encodings.get(encodings[eid], 0) + n
+
+    def file_done(self, file_path, seconds):
+        self.count('files')
+        if len(self.slowest) < self.top:
+            heapq.heappush(self.slowest, (seconds, file_path))
+        elif seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (seconds, file_path))
+
+    def to_dict(self):
+        return {
+            'phases'        : self.phases,
+            'counters'      : self.counters,
+            'encoding_index': self.encoding_index,
+            'encodings'     : self.encodings,
+            'slowest'       : sorted(self.slowest, reverse=True),
+        }
+
+    def merge(self, stats):
+        for name, value in stats['phases'].items():
+            self.phases[name] = self.phases.get(name, 0.0) + value
+        for name, value in stats['counters'].items():
+            self.count(name, value)
+        for name, value in stats['encoding_index'].items():
+            # NOTE: keys become str if stats went through JSON (merge-reports)
+            self.encoding_index[int(name)] = self.encoding_index.get(int(name), 0) + value
+        for name, value in stats['encodings'].items():
+            self.encodings[name] = self.encodings.get(name, 0) + value
+        for seconds, file_path in stats['slowest']:
+            self.count('files', -1)
+            self.file_done(file_path, seconds)
+
+
+def _timed(iterable, stats, phase):
+    """Yields items of iterable and adds time spent to produce them to phase"""
+    it = iter(iterable)
+    while True:
+        t = time.perf_counter()
+        try:
+            item = next(it)
+        except StopIteration:
+            stats.phase(phase, t)
+            return
+        stats.phase(phase, t)
+        yield item
+
+
+def _write_file(path, data, mode_path=None):
+    """Writes data into temporary file next to path (or next to its target, if it's a symlink)
+    and replaces it with that file"""
+    f = _AtomicFile(path, mode_path)
+    try:
+        f.write(data)
+    except BaseException:
+        f.discard()
+        raise
+    f.commit()
+
+
+def _same_content(path, data):
+    try:
+        if os.path.getsize(path) != len(data):
+            return False
+        with open(path, "rb") as f:
+            return f.read() == data
+    except OSError:
+        return False
+
+
+def _get_properties(file_path):
+    if E_CONF is None:
+        return {}
+    try:
+        return E_CONF[0](file_path)
+    except E_CONF[1]:
+        return {}
+
+
+class _ConfigResolver:
+    """Resolves '.editorconfig' properties of files exactly as get_properties does,
+    but parses each '.editorconfig' file only once and memoizes resolved properties
+    by chain of '.editorconfig' files and set of sections that are matching file.
+    Falls back to plain get_properties if editorconfig module internals are not available"""
+
+    def __init__(self):
+        self._records = {}      # Directory -> parsed '.editorconfig' within it
+        self._chains = {}       # Directory -> list of parsed '.editorconfig' files, that are applicable to it
+        self._resolved = {}     # (chain, matching sections) -> properties
+
+    def _record(self, directory):
+        """Returns (path, sections, root, error) for '.editorconfig' within directory,
+        where sections is a list of (glob, [(option, value), ...])"""
+        if directory not in self._records:
+            conf_path = os.path.join(directory, '.editorconfig')
+            sections = []
+
+            class Options(dict):
+                def __setitem__(self, key, value):
+                    sections[-1][1].append((key, value))
+
+            def record_section(config_filename, glob):
+                sections.append((glob, []))
+                return True
+
+            parser = E_CONF_INTERNALS[1](conf_path)
+            parser.options = Options()
+            parser.matches_filename = record_section
+            error = None
+            try:
+                parser.read(conf_path)
+            except E_CONF[1] as e:
+                error = e
+            self._records[directory] = (conf_path, sections, parser.root_file, error)
+        return self._records[directory]
+
+    def _chain(self, directory):
+        if directory not in self._chains:
+            record = self._record(directory)
+            parent = os.path.dirname(directory)
+            if record[2] or parent == directory:
+                self._chains[directory] = (record, )
+            else:
+                self._chains[directory] = (record, *self._chain(parent))
+        return self._chains[directory]
+
+    def invalidate(self):
+        """Forgets parsed '.editorconfig' files and resolved properties"""
+        self._records.clear()
+        self._chains.clear()
+        self._resolved.clear()
+
+    def get_properties(self, file_path):
+        if E_CONF is None:
+            return {}
+        if E_CONF_INTERNALS is None or not os.path.isabs(file_path):
+            return _get_properties(file_path)
+
+        chain = self._chain(os.path.dirname(file_path))
+        for record in chain:
+            if record[3] is not None:
+                return {}
+
+        matcher = E_CONF_INTERNALS[1](file_path)
+        matching = tuple(
+            matcher.matches_filename(record[0], glob) for record in chain for glob, _ in record[1])
+        key = (tuple(record[0] for record in chain), matching)
+        if key not in self._resolved:
+            # NOTE: same merge order as in EditorConfigHandler.get_configurations
+            options = OrderedDict()
+            i = 0
+            for record in chain:
+                record_options = OrderedDict()
+                for _, section_options in record[1]:
+                    if matching[i]:
+                        for k, v in section_options:
+                            record_options[k] = v
+                    i += 1
+                record_options.update(options)
+                options = record_options
+            handler = E_CONF_INTERNALS[0](file_path)
+            handler.options = options
+            handler.preprocess_values()
+            self._resolved[key] = handler.options
+        return OrderedDict(self._resolved[key])
+
+
+# NOTE: only signatures that are unlikely to start a text file
+_BINARY_MAGIC = (
+    b'\x89PNG', b'\xff\xd8\xff', b'GIF87a', b'GIF89a', b'%PDF-', b'PK\x03\x04', b'PK\x05\x06', b'\x1f\x8b',
+    b'\x7fELF', b'7z\xbc\xaf\x27\x1c', b'\xfd7zXZ\x00', b'\x28\xb5\x2f\xfd', b'Rar!\x1a\x07',
+    b'\xca\xfe\xba\xbe', b'\xcf\xfa\xed\xfe', b'\xce\xfa\xed\xfe', b'SQLite format 3\x00', b'\x00asm',
+    b'OggS\x00', b'wOFF', b'wOF2', b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1',
+)
+# Control chars that are not expected within text
+_CONTROL_BYTES = bytes(c for c in range(32) if c not in b'\t\n\r\f\b\x0b\x1b') + b'\x7f'
+_NOT_CONTROL_BYTES = bytes(c for c in range(256) if c not in _CONTROL_BYTES)
+
+
+def _sniff_binary(f, encodings, size=SNIFF_SIZE):
+    """Same as _is_binary for head of file. File position is left at the beginning of file"""
+    head = f.read(size)
+    f.seek(0)
+    return _is_binary(head, encodings)
+
+
+def _is_binary(head, encodings):
+    """Checks head of content for magic numbers of common binary formats, NUL bytes and ratio of control chars.
+    NUL bytes and control chars are not checked if encodings contain UTF-16 or UTF-32"""
+    head = head[:SNIFF_SIZE]
+    if head.startswith(_BINARY_MAGIC):
+        return True
+    for encoding in encodings:
+        try:
+            if codecs.lookup(encoding).name.startswith(('utf-16', 'utf-32')):
+                return False
+        except LookupError:
+            pass
+    if b'\x00' in head:
+        return True
+    return len(head.translate(None, _NOT_CONTROL_BYTES)) * 10 > len(head)
+
+
+def _resolve_encodings(options, encodings):
+    """Returns (encodings, encoding), where encoding is charset from '.editorconfig' properties (or None),
+    which is put in front of encodings"""
+    if encodings is None:
+        encodings = ENCODINGS
+    encoding = options.get('charset')
+    if encoding is not None:
+        encodings = (encoding, *encodings)
+    return encodings, encoding
+
+
+def _format_raw(fb, options, encodings, encoding, tab_width, use_tabs, trim, line_endings, suggest, stats=None):
+    """Same as _format_content (without realign), but content isn't decoded and encoded back with its encoding.
+    Returns None if it's not possible: the first encoding isn't ASCII-compatible (see _bulk_decodable),
+    output encoding differs from it, content isn't valid for it, or content has multibyte chars
+    and display position of whitespaces matters (tabs are used or there are tabs within content)"""
+    target = encodings[0]
+    if encoding not in (None, target) or not _bulk_decodable(target):
+        return None
+    if stats is not None:
+        t = time.perf_counter()
+    ascii_only = fb.isascii()
+    # NOTE: the rest of ASCII-compatible encodings are single byte ones
+    multibyte = not ascii_only and codecs.lookup(target).name == 'utf-8'
+    lb = _detect_line_break(fb)
+    mixed = lb is not None and fb.count(b'\r') + fb.count(b'\n') != fb.count(lb) * len(lb)
+
+    def starting_with(ws):
+        return fb.startswith(ws) + (0 if lb is None else fb.count(lb + ws))
+
+    resolved = {}
+    use_tabs, tab_width, trim, line_endings = _resolve_format(
+        options, lambda: (starting_with(b'\t'), starting_with(b' ')), use_tabs, tab_width, trim, line_endings,
+        resolved)
+    if multibyte and (use_tabs or mixed or b'\t' in fb):
+        return None
+    if not ascii_only:
+        try:
+            fb.decode(target)
+        except UnicodeDecodeError:
+            return None
+    if encoding is None:
+        suggest['charset'] = target
+    suggest.update(resolved)
+
+    if len(fb) == 0:
+        return b''
+    if lb is None:
+        lb = o_lb = b'\n'
+    else:
+        o_lb = lb if line_endings is None else line_endings.encode()
+    if stats is not None:
+        t = stats.phase('decode', t)
+        lines_count = fb.count(lb) + (not fb.endswith(lb))
+        stats.count('lines', lines_count)
+        stats.count_encodings(encodings, [lines_count] + [0] * (len(encodings) - 1))
+
+    if not use_tabs and not mixed:
+        # NOTE: column is reset by line breaks, so tabs are expanded within whole content at once
+        o_data = fb.expandtabs(tab_width) if b'\t' in fb else fb
+        if trim:
+            o_data = o_lb.join([l.rstrip(b' ') for l in o_data.split(lb)])
+        elif o_lb != lb:
+            o_data = o_data.replace(lb, o_lb)
+    else:
+        # NOTE: latin-1 maps bytes into chars one to one, so content is copied into str as is
+        lines = fb.decode('latin-1').split(lb.decode())
+        no_last_line_break = len(lines[-1]) > 0
+        if not no_last_line_break:
+            lines.pop()
+        o_text = o_lb.decode().join(_format_lines(lines, use_tabs, tab_width, trim, False))
+        if not no_last_line_break:
+            o_text += o_lb.decode()
+        o_data = o_text.encode('latin-1')
+    if stats is not None:
+        stats.phase('fix', t)
+    return o_data
+
+
+def _format_content(
+        fb, options, encodings, encoding, tab_width, use_tabs, trim, line_endings, realign, suggest, stats=None,
+        observed=None):
+    """Returns formatted raw content. Suggestions are added into suggest dict.
+    encoding is the output encoding, if it's None then it's detected from content.
+    If observed dict is specified, then properties observed within content (see _observe) are added to it"""
+    if not realign and observed is None:
+        # NOTE: column of chars matters for realign, so it's done with str only
+        o_data = _format_raw(
+            fb, options, encodings, encoding, tab_width, use_tabs, trim, line_endings, suggest, stats)
+        if o_data is not None:
+            return o_data
+    if stats is not None:
+        t = time.perf_counter()
+    counts = None
+    if stats is not None:
+        counts = [0] * len(encodings)
+    lines, encoding_index, line_break, no_last_line_break = _read_lines(fb, encodings, counts)
+    if encoding is None:
+        encoding = encodings[encoding_index]
+        suggest['charset'] = encoding
+    if stats is not None:
+        t = stats.phase('decode', t)
+        stats.count('lines', len(lines))
+        stats.count_encodings(encodings, counts)
+    if observed is not None:
+        observed.update(_observe(lines, [line_break, None][no_last_line_break and len(lines) == 1],
+                                 encodings[encoding_index]))
+
+    use_tabs, tab_width, trim, line_endings = _resolve_format(
+        options, lambda: _indent_counts(lines), use_tabs, tab_width, trim, line_endings, suggest)
+
+    if len(fb) == 0:
+        return b''
+    if line_endings is not None:
+        line_break = line_endings
+    o_text = line_break.join(_format_lines(lines, use_tabs, tab_width, trim, realign, stats))
+    if not no_last_line_break:
+        o_text += line_break
+    if stats is not None:
+        t = time.perf_counter()
+    o_data = o_text.encode(encoding)
+    if stats is not None:
+        stats.phase('encode', t)
+    return o_data
+
+
+def _check_content(
+        fb, options, encodings, encoding, tab_width, use_tabs, trim, line_endings, realign, suggest, stats=None,
+        observed=None):
+    """Checks whether _format_content would return content as is. Lines are checked one by one and checking
+    stops on the first violation, formatted content isn't built (except of alignment of columns).
+    stats and observed are the same as for _format_content. Returns description of the first violation or None"""
+    if stats is not None:
+        t = time.perf_counter()
+    counts = None
+    if stats is not None:
+        counts = [0] * len(encodings)
+    lines, encoding_index, line_break, no_last_line_break = _read_lines(fb, encodings, counts)
+    if encoding is None:
+        encoding = encodings[encoding_index]
+        suggest['charset'] = encoding
+    if stats is not None:
+        t = stats.phase('decode', t)
+        stats.count('lines', len(lines))
+        stats.count_encodings(encodings, counts)
+    try:
+        return _check_lines(
+            fb, lines, encoding_index, line_break, no_last_line_break, options, encodings, encoding, tab_width,
+            use_tabs, trim, line_endings, realign, suggest, observed)
+    finally:
+        if stats is not None:
+            stats.phase('check', t)
+
+
+def _check_lines(
+        fb, lines, encoding_index, line_break, no_last_line_break, options, encodings, encoding, tab_width, use_tabs,
+        trim, line_endings, realign, suggest, observed):
+    """_check_content of decoded lines"""
+    if observed is not None:
+        observed.update(_observe(lines, [line_break, None][no_last_line_break and len(lines) == 1],
+                                 encodings[encoding_index]))
+
+    use_tabs, tab_width, trim, line_endings = _resolve_format(
+        options, lambda: _indent_counts(lines), use_tabs, tab_width, trim, line_endings, suggest)
+
+    if len(fb) == 0:
+        return None
+    if line_endings is not None and line_endings != line_break and (len(lines) > 1 or not no_last_line_break):
+        return f"line 1: line endings should be {line_endings.encode('unicode_escape').decode()}"
+    # NOTE: lines are formatted lazily, except of alignment of columns which depends on the following lines
+    for i, (l, o_l) in enumerate(zip(lines, _format_lines(lines, use_tabs, tab_width, trim, realign))):
+        if l != o_l:
+            return f"line {i + 1}: whitespaces"
+    if encoding_index == 0 and encoding == encodings[0] and _bulk_decodable(encoding):
+        # NOTE: content is decoded and would be encoded with the same encoding, which is reversible
+        return None
+    o_text = line_break.join(lines)
+    if not no_last_line_break:
+        o_text += line_break
+    try:
+        if o_text.encode(encoding) == fb:
+            return None
+    except UnicodeError:
+        pass
+    return f"charset should be {encoding}"
+
+
+def _diff_content(file_path, fb, o_data, encodings):
+    """Returns unified diff of raw content and formatted raw content"""
+    def lines(data):
+        text_lines, _, line_break, no_last_line_break = _read_lines(data, encodings)
+        text = line_break.join(text_lines)
+        if not no_last_line_break:
+            text += line_break
+        # NOTE: lines are split by '\n' only (as patch does), other line breaks are kept within lines
+        result = [l + "\n" for l in text.split("\n")]
+        if result[-1] == "\n":
+            result.pop()
         else:
-            o_l = fix_spaces(l, tab_width, trim)
-        result.append(o_l)
+            result[-1] = result[-1] + "\\ No newline at end of file\n"
+        return result
+    file_path = os.path.relpath(file_path)
+    return "".join(difflib.unified_diff(lines(fb), lines(o_data), f"a/{file_path}", f"b/{file_path}"))
 
-    if realign:
-        to_realign = result
-        result = []
-        # TODO: try to analyze adjacent lines and get 2D chunks
-        for l in to_realign:
-            o_l = realign_text(l, use_tabs, tab_width)
-            result.append(o_l)
 
+# Options of format_bytes and their defaults
+FORMAT_OPTIONS = {
+    'encodings'     : None,
+    'tab_width'     : None,
+    'use_tabs'      : None,
+    'trim'          : None,
+    'line_endings'  : None,
+    'realign'       : False,
+    'all_files'     : False,
+    'sniff_binary'  : True,
+}
+_FORMAT_RESOLVER = None
+
+
+def format_bytes(data, *, path_hint=None, options=None):
+    """Formats raw content in memory same as fix_indents_in_file formats file. Returns (bytes, suggest).
+    '.editorconfig' properties are resolved for path_hint (if specified), parsed '.editorconfig' files are kept
+    in memory between calls (see reset_config_cache). Content that isn't covered by '.editorconfig'
+    (unless 'all_files' option is True) is returned as is.
+    options is a dict with keys of FORMAT_OPTIONS. Raises ValueError for unknown options and binary content"""
+    global _FORMAT_RESOLVER
+    options = dict(FORMAT_OPTIONS, **(options or {}))
+    if len(options) != len(FORMAT_OPTIONS):
+        raise ValueError(f"Unknown options: {', '.join(sorted(options.keys() - FORMAT_OPTIONS.keys()))}")
+    properties = {}
+    if path_hint is not None:
+        if _FORMAT_RESOLVER is None:
+            _FORMAT_RESOLVER = _ConfigResolver()
+        properties = _FORMAT_RESOLVER.get_properties(os.path.abspath(path_hint))
+    suggest = {}
+    if E_CONF is not None and not options['all_files'] and len(properties) == 0:
+        return data, suggest
+    encodings, encoding = _resolve_encodings(properties, options['encodings'])
+    if options['sniff_binary'] and _is_binary(data, encodings):
+        raise ValueError("Content looks like binary!")
+    o_data = _format_content(
+        data, properties, encodings, encoding, options['tab_width'], options['use_tabs'], options['trim'],
+        options['line_endings'], options['realign'], suggest)
+    return o_data, suggest
+
+
+def reset_config_cache():
+    """Forgets '.editorconfig' files parsed by format_bytes"""
+    if _FORMAT_RESOLVER is not None:
+        _FORMAT_RESOLVER.invalidate()
+
+
+def fix_indents_in_file(
+        file_path, output_path=None,
+        encodings=None, tab_width=None, use_tabs=None, trim=None, line_endings=None, realign=False, all_files=False,
+        sniff_binary=True, max_size=None):
+    return _fix_indents_in_file(
+        file_path, output_path, encodings, tab_width, use_tabs, trim, line_endings, realign, all_files,
+        sniff_binary=sniff_binary, max_size=max_size)['suggest']
+
+
+def _fix_indents_in_file(
+        file_path, output_path=None,
+        encodings=None, tab_width=None, use_tabs=None, trim=None, line_endings=None, realign=False, all_files=False,
+        properties=None, cache_digest=None, stream_threshold=STREAM_THRESHOLD, stats=None,
+        sniff_binary=True, max_size=None, observe=False, data=None, write=None, check=False, diff=False):
+    """Returns result dict with suggestions and status of file, which is one of:
+    'ignored' - file isn't covered by '.editorconfig', 'untouched' - file is already well formatted,
+    'written' - result is written, 'binary' - file looks like binary (if sniff_binary is True)
+    or it's larger than max_size (if specified).
+    properties are '.editorconfig' properties of file if they are already known.
+    If cache_digest is specified (b'' if it's not known yet), then result also contains 'cache' entry
+    with (size, mtime_ns, inode, digest) of source file, and if file content matches cache_digest
+    then it's considered well formatted without further processing.
+    Files larger than stream_threshold are processed without loading them into memory.
+    If stats (_Stats) are specified, then time of processing phases and counters are added to them.
+    If observe is True, then result of text file (even if it's not covered by '.editorconfig')
+    also contains 'observed' dict with properties observed within it (see _observe).
+    data is (content, os.stat_result) of file if it's already read.
+    If write is specified, then it's called instead of writing of result as write(output_path, data, file_path)
+    and returned value is put into result as 'pending'.
+    Result of processed text file also contains 'encoding' of its content.
+    If check is True, then nothing is written and status of badly formatted file is 'unformatted',
+    result also contains 'violation' with description of the first violation.
+    If diff is True, then nothing is written and result of badly formatted file also contains 'diff'
+    with unified diff of it ('diff' of files processed by streaming is None, they have 'violation' instead)"""
+    suggest = {}
+    if stats is not None:
+        t = time.perf_counter()
+
+    if data is not None:
+        st = data[1]
+    else:
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            raise ValueError(f"File '{file_path}' not found!")
+    if not stat.S_ISREG(st.st_mode):
+        raise ValueError(f"Path '{file_path}' should point to file!")
+
+    if properties is not None:
+        options = properties
+    else:
+        options = _get_properties(file_path)
+        if stats is not None:
+            t = stats.phase('config', t)
+    cache_entry = None
+
+    encodings, encoding = _resolve_encodings(options, encodings)
+
+    if E_CONF is not None and not all_files and len(options) == 0:
+        result = {'suggest': suggest, 'status': 'ignored'}
+        if observe:
+            try:
+                with open(file_path, "rb") as f:
+                    result['observed'] = _observe_file(f, encodings, max(stream_threshold, 1 << 20))
+            except ValueError:
+                # NOTE: file isn't processed, so it's not an error if it can't be decoded
+                pass
+        return result
+
+    size = st.st_size
+    if max_size is not None and size > max_size:
+        return {'suggest': suggest, 'status': 'binary'}
+
+    if size > max(stream_threshold, 0):
+        observed = None
+        if observe:
+            # NOTE: properties of large file are observed within its head
+            with open(file_path, "rb") as f:
+                observed = _observe_file(f, encodings, 1 << 20)
+        result = _fix_indents_in_large_file(
+            file_path, output_path, options, encodings, encoding, tab_width, use_tabs, trim, line_endings, realign,
+            suggest, cache_digest, stats, sniff_binary, check or diff)
+        result['observed'] = observed
+        if result['status'] != 'binary':
+            result['encoding'] = encoding or suggest.get('charset')
+        if diff and result['status'] == 'unformatted':
+            # NOTE: diff of large file isn't produced, since it would take memory proportional to file size
+            result['diff'] = None
+        return result
+
+    if data is not None:
+        fb = data[0]
+        if sniff_binary and _is_binary(fb, encodings):
+            return {'suggest': suggest, 'status': 'binary'}
+    else:
+        with open(file_path, "rb") as f:
+            if sniff_binary and _sniff_binary(f, encodings):
+                return {'suggest': suggest, 'status': 'binary'}
+            fb = f.read()
+            st = os.fstat(f.fileno())
+    if stats is not None:
+        t = stats.phase('read', t)
+        stats.count('bytes_read', len(fb))
+    if cache_digest is not None:
+        cache_entry = (st.st_size, st.st_mtime_ns, st.st_ino, hashlib.blake2b(fb, digest_size=16).digest())
+        if cache_entry[3] == cache_digest:
+            return {'suggest': suggest, 'status': 'untouched', 'cache': cache_entry}
+
+    observed = None
+    if observe:
+        observed = {}
+    if check:
+        violation = _check_content(
+            fb, options, encodings, encoding, tab_width, use_tabs, trim, line_endings, realign, suggest, stats,
+            observed)
+        encoding = encoding or suggest['charset']
+        if violation is None:
+            return {'suggest': suggest, 'status': 'untouched', 'cache': cache_entry, 'observed': observed,
+                    'encoding': encoding}
+        return {'suggest': suggest, 'status': 'unformatted', 'violation': violation, 'observed': observed,
+                'encoding': encoding}
+    o_data = _format_content(
+        fb, options, encodings, encoding, tab_width, use_tabs, trim, line_endings, realign, suggest, stats, observed)
+    if stats is not None:
+        t = time.perf_counter()
+    encoding = encoding or suggest['charset']
+
+    if diff:
+        if o_data == fb:
+            return {'suggest': suggest, 'status': 'untouched', 'cache': cache_entry, 'observed': observed,
+                    'encoding': encoding}
+        return {'suggest': suggest, 'status': 'unformatted', 'observed': observed, 'encoding': encoding,
+                'diff': _diff_content(file_path, fb, o_data, encodings)}
     if output_path is not None:
         os.makedirs(os.path.split(output_path)[0], exist_ok=True)
+        unchanged = _same_content(output_path, o_data)
     else:
         output_path = file_path
-    with open(output_path, "wb") as f:
-        if len(fb) > 0:
-            if line_endings is not None:
-                line_break = line_endings
-            o_text = line_break.join([l[:-1] for l in result])
-            if not no_last_line_break:
-                o_text += line_break
-            f.write(o_text.encode(encoding))
-
-    return suggest
-
-
-def _skip(file_path, include, exclude):
-    skip = False
-
-    if include is not None:
-        skip = True
-        for ptn in include:
-            m = re.match(ptn, file_path.lower())
-            if m is not None:
-                skip = False
-                break
+        unchanged = o_data == fb
+    if unchanged:
+        if stats is not None:
+            stats.phase('write', t)
+        return {'suggest': suggest, 'status': 'untouched', 'cache': cache_entry, 'observed': observed,
+                'encoding': encoding}
+    result = {'suggest': suggest, 'status': 'written', 'observed': observed, 'encoding': encoding}
+    if write is not None:
+        result['pending'] = write(output_path, o_data, file_path)
+    else:
+        _write_file(output_path, o_data, file_path)
+    if stats is not None:
+        stats.phase('write', t)
+        stats.count('bytes_written', len(o_data))
+
+    return result
+
+
+def _copy_prefix(src, dst, size):
+    if size == 0:
+        return
+    src.seek(0)
+    while size > 0:
+        data = src.read(min(size, 1 << 20))
+        if len(data) == 0:
+            break
+        dst.write(data)
+        size -= len(data)
+
+
+def _detect_line_break_in_file(f, block_size):
+    """Same as _detect_line_break, but reads file block by block"""
+    has_lf = False
+    has_cr = False
+    last = b''
+    f.seek(0)
+    while True:
+        block = f.read(block_size)
+        if len(block) == 0:
+            break
+        if b'\r\n' in last + block[:1] or b'\r\n' in block:
+            return b'\r\n'
+        has_lf = has_lf or b'\n' in block
+        has_cr = has_cr or b'\r' in block
+        last = block[-1:]
+    if has_lf:
+        return b'\n'
+    if has_cr:
+        return b'\r'
+    return None
 
-    if not skip and exclude is not None:
-        for ptn in exclude:
-            m = re.match(ptn, file_path.lower())
-            if m is not None:
-                skip = True
+
+def _iter_line_blocks(f, lb, block_size):
+    """Yields raw content of file block by block. Each block consists of whole lines, without the last line break.
+    Only the longest line and a block are kept in memory"""
+    rest = b''
+    f.seek(0)
+    while True:
+        block = f.read(block_size)
+        if len(block) == 0:
+            break
+        buf = rest + block
+        end = -1 if lb is None else buf.rfind(lb)
+        if end < 0:
+            rest = buf
+            continue
+        yield buf[:end]
+        rest = buf[end + len(lb):]
+    if len(rest) > 0:
+        yield rest
+
+
+def _fix_indents_in_large_file(
+        file_path, output_path, options, encodings, encoding, tab_width, use_tabs, trim, line_endings, realign,
+        suggest, cache_digest, stats=None, sniff_binary=True, check=False, block_size=1 << 20):
+    """Same as _fix_indents_in_file, but memory usage doesn't depend on file size.
+    If check is True, then nothing is written and 'unformatted' status is returned on the first difference.
+    File is read block by block in up to three passes: the first one detects line break,
+    the second one (if necessary) detects encoding and indentation, the last one formats and writes lines.
+    While formatted content is the same as existing one nothing is written at all"""
+    cache_entry = None
+    if stats is not None:
+        t = time.perf_counter()
+    with open(file_path, "rb") as f:
+        if sniff_binary and _sniff_binary(f, encodings):
+            return {'suggest': suggest, 'status': 'binary'}
+        if stats is not None:
+            stats.count('bytes_read', os.fstat(f.fileno()).st_size)
+        if cache_digest is not None:
+            st = os.fstat(f.fileno())
+            digest = hashlib.blake2b(digest_size=16)
+            while True:
+                block = f.read(block_size)
+                if len(block) == 0:
+                    break
+                digest.update(block)
+            cache_entry = (st.st_size, st.st_mtime_ns, st.st_ino, digest.digest())
+            if cache_entry[3] == cache_digest:
+                return {'suggest': suggest, 'status': 'untouched', 'cache': cache_entry}
+
+        lb = _detect_line_break_in_file(f, block_size)
+        if lb is None:
+            line_break = '\n'
+            no_last_line_break = True
+        else:
+            line_break = lb.decode()
+            f.seek(-len(lb), os.SEEK_END)
+            no_last_line_break = f.read() != lb
+        if stats is not None:
+            t = stats.phase('read', t)
+
+        tabs = 0
+        spaces = 0
+        if encoding is None or (use_tabs is None and 'indent_style' not in options):
+            encoding_index = 0
+            for block in _iter_line_blocks(f, lb, block_size):
+                lines, block_encoding_index = _decode_buffer(block, lb, encodings)
+                if block_encoding_index > encoding_index:
+                    encoding_index = block_encoding_index
+                block_tabs, block_spaces = _indent_counts(lines)
+                tabs += block_tabs
+                spaces += block_spaces
+            if encoding is None:
+                encoding = encodings[encoding_index]
+                suggest['charset'] = encoding
+            if stats is not None:
+                t = stats.phase('decode', t)
+
+        use_tabs, tab_width, trim, line_endings = _resolve_format(
+            options, lambda: (tabs, spaces), use_tabs, tab_width, trim, line_endings, suggest)
+        if line_endings is not None:
+            line_break = line_endings
+
+        if output_path is not None and not check:
+            os.makedirs(os.path.split(output_path)[0], exist_ok=True)
+            reference = open(output_path, "rb") if os.path.isfile(output_path) else None
+        else:
+            output_path = file_path
+            reference = open(file_path, "rb")
+
+        out = None
+        same = reference is not None
+        pos = 0
+        counts = None
+        if stats is not None:
+            counts = [0] * len(encodings)
+        try:
+            encoder = codecs.getincrementalencoder(encoding)()
+            first = True
+            aligner = None
+            if realign == REALIGN_COLUMNS:
+                # NOTE: blocks of aligned lines may cross boundaries of blocks read from file
+                aligner = _ColumnAligner(use_tabs, tab_width)
+            for block in _iter_line_blocks(f, lb, block_size):
+                lines, _ = _decode_buffer(block, lb, encodings, counts)
+                if stats is not None:
+                    t = stats.phase('decode', t)
+                    stats.count('lines', len(lines))
+                o_lines = _format_lines(lines, use_tabs, tab_width, trim, realign, stats, aligner)
+                if aligner is not None and len(o_lines) == 0:
+                    continue
+                o_text = line_break.join(o_lines)
+                if not first:
+                    o_text = line_break + o_text
+                first = False
+                if stats is not None:
+                    t = time.perf_counter()
+                data = encoder.encode(o_text)
+                if stats is not None:
+                    t = stats.phase('encode', t)
+                if same:
+                    if reference.read(len(data)) == data:
+                        pos += len(data)
+                        if stats is not None:
+                            t = stats.phase('write', t)
+                        continue
+                    same = False
+                if check:
+                    return {'suggest': suggest, 'status': 'unformatted', 'violation': "content differs"}
+                if out is None:
+                    out = _AtomicFile(output_path, file_path)
+                    _copy_prefix(reference, out, pos)
+                out.write(data)
+                if stats is not None:
+                    t = stats.phase('write', t)
+            o_text = ['', line_break][not no_last_line_break]
+            if aligner is not None:
+                o_lines = aligner.finish()
+                if len(o_lines) > 0:
+                    o_text = ['', line_break][not first] + line_break.join(o_lines) + o_text
+            data = encoder.encode(o_text, final=True)
+            if stats is not None:
+                stats.count_encodings(encodings, counts)
+            if same:
+                same = reference.read(len(data)) == data and len(reference.read(1)) == 0
+                if same:
+                    if stats is not None:
+                        stats.phase('write', t)
+                    return {'suggest': suggest, 'status': 'untouched', 'cache': cache_entry}
+            if check:
+                return {'suggest': suggest, 'status': 'unformatted', 'violation': "content differs"}
+            if out is None:
+                out = _AtomicFile(output_path, file_path)
+                _copy_prefix(reference, out, pos)
+            out.write(data)
+        except BaseException:
+            if out is not None:
+                out.discard()
+            raise
+        finally:
+            if reference is not None:
+                reference.close()
+        out.commit()
+        if stats is not None:
+            stats.phase('write', t)
+            stats.count('bytes_written', os.path.getsize(output_path))
+
+    return {'suggest': suggest, 'status': 'written'}
+
+
+class _Cache:
+    """Persistent cache of files which are known to be well formatted with certain options.
+    Entry is valid while file's size, mtime and inode are the same.
+    If they have changed, but content digest is the same, then file is still considered as well formatted.
+    Least recently used entries are evicted when number of entries exceeds max_entries"""
+
+    # NOTE: files modified less than this number of seconds before check may be modified again
+    #       within same mtime tick without being noticed, so they aren't cached
+    RACY_INTERVAL = 2
+
+    def __init__(self, path, max_entries):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER,"
+            " digest BLOB, options TEXT, used INTEGER)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS files_used ON files (used)")
+        meta = dict(self._db.execute("SELECT key, value FROM meta"))
+        if meta.get('version') != VERSION:
+            self._db.execute("DELETE FROM files")
+        self._run = int(meta.get('run', 0)) + 1
+        self._db.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (('version', VERSION), ('run', str(self._run))))
+        self._hits = []
+
+    @staticmethod
+    def options_key(options, properties):
+        key = [VERSION] + [options[k] for k in (
+            'encodings', 'tab_width', 'use_tabs', 'trim', 'line_endings', 'realign')] + [sorted(properties.items())]
+        return hashlib.blake2b(json.dumps(key).encode(), digest_size=16).hexdigest()
+
+    def lookup(self, file_path, st, options_key):
+        """Returns True if file is known to be well formatted,
+        otherwise returns digest of previously cached content (b'' if there is nothing to compare with)"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT size, mtime_ns, inode, digest, options FROM files WHERE path = ?", (file_path, )).fetchone()
+        if row is None or row[4] != options_key or row[0] != st.st_size:
+            return b''
+        if row[1] == st.st_mtime_ns and row[2] == st.st_ino:
+            self._hits.append(file_path)
+            return True
+        return row[3]
+
+    def store(self, file_path, cache_entry, options_key):
+        size, mtime_ns, inode, digest = cache_entry
+        if mtime_ns >= (time.time() - self.RACY_INTERVAL) * 1e9:
+            return
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns, inode, digest, options, used)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (file_path, size, mtime_ns, inode, digest, options_key, self._run))
+
+    def close(self):
+        with self._lock:
+            self._db.executemany("UPDATE files SET used = ? WHERE path = ?", ((self._run, p) for p in self._hits))
+            count = self._db.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+            if count > self.max_entries:
+                self._db.execute(
+                    "DELETE FROM files WHERE path IN (SELECT path FROM files ORDER BY used LIMIT ?)",
+                    (count - self.max_entries, ))
+            self._db.commit()
+            self._db.close()
+
+
+class _PathMatcher:
+    """Include/exclude patterns compiled once. Patterns are matched from the start of lower-cased path,
+    same as re.match does, so all patterns of a kind are combined into single alternation.
+    Directories are pruned only by exclude patterns that match directory path regardless of what follows it"""
+
+    # NOTE: with these constructs match of a prefix doesn't imply match of a longer path
+    _UNSAFE_PRUNE = ("$", "\\Z", "\\b", "\\B", "(?=", "(?!")
+
+    def __init__(self, include=None, exclude=None):
+        self.include = self._compile(include)
+        self.exclude = self._compile(exclude)
+        self.prune = None
+        if exclude is not None:
+            self.prune = self._compile([p for p in exclude if not any(u in p for u in self._UNSAFE_PRUNE)])
+
+    @staticmethod
+    def _compile(patterns):
+        if patterns is None or len(patterns) == 0:
+            return None
+        try:
+            return re.compile("|".join(f"(?:{p})" for p in patterns)).match
+        except re.error:
+            # NOTE: patterns with global flags can't be combined
+            compiled = [re.compile(p).match for p in patterns]
+            return lambda path: next((m for m in (c(path) for c in compiled) if m is not None), None)
+
+    def skip(self, file_path):
+        file_path = file_path.lower()
+        if self.include is not None and self.include(file_path) is None:
+            return True
+        return self.exclude is not None and self.exclude(file_path) is not None
+
+    def skip_dir(self, dir_path):
+        """Returns True if every file within dir_path is excluded"""
+        if self.prune is None:
+            return False
+        m = self.prune(os.path.join(dir_path, "").lower())
+        return m is not None
+
+
+class _IgnoreRules:
+    """Rules of '.gitignore'-like file: globs with '*', '?', '**' and '[...]', '!' negation,
+    trailing '/' for directories only, leading or middle '/' anchors pattern to ignore file's folder.
+    The last matching rule wins"""
+
+    def __init__(self, file_path):
+        rules = []
+        with open(file_path, "r", encoding='utf-8', errors='replace') as f:
+            for line in f:
+                line = line.rstrip("\r\n")
+                if line.endswith("\\ "):
+                    line = line[:-2] + " "
+                else:
+                    line = line.rstrip(" ")
+                if len(line) == 0 or line[0] == "#":
+                    continue
+                negate = line[0] == "!"
+                if negate or line[0] == "\\":
+                    line = line[1:]
+                dir_only = line.endswith("/")
+                line = line.rstrip("/")
+                if len(line) == 0:
+                    continue
+                regex = self._translate(line.lstrip("/"))
+                if "/" not in line:
+                    regex = "(?:.*/)?" + regex
+                rules.append((f"(?:{regex})\\Z", negate, dir_only))
+        if not any(negate for _, negate, _ in rules):
+            # NOTE: without negations order doesn't matter, so rules are combined into single alternation per kind
+            rules = [
+                ("|".join(r for r, _, d in rules if d == dir_only), False, dir_only)
+                for dir_only in (False, True) if any(d == dir_only for _, _, d in rules)]
+        self.rules = [(re.compile(r, re.DOTALL).match, negate, dir_only) for r, negate, dir_only in rules]
+
+    @staticmethod
+    def _translate(glob):
+        result = []
+        i = 0
+        n = len(glob)
+        while i < n:
+            c = glob[i]
+            if glob.startswith("**/", i):
+                result.append("(?:.*/)?")
+                i += 3
+                continue
+            if glob.startswith("/**", i) and i + 3 == n:
+                result.append("/.*")
+                i += 3
+                continue
+            if glob.startswith("**", i):
+                result.append(".*")
+                i += 2
+                continue
+            if c == "*":
+                result.append("[^/]*")
+            elif c == "?":
+                result.append("[^/]")
+            elif c == "[":
+                j = glob.find("]", i + 2)
+                if j < 0:
+                    result.append(re.escape(c))
+                else:
+                    cls = glob[i+1:j].replace("\\", "\\\\")
+                    if cls[0] == "!":
+                        cls = "^" + cls[1:]
+                    result.append(f"[{cls}]")
+                    i = j
+            elif c == "\\" and i + 1 < n:
+                i += 1
+                result.append(re.escape(glob[i]))
+            else:
+                result.append(re.escape(c))
+            i += 1
+        return "".join(result)
+
+    def match(self, rel_path, is_dir):
+        """Returns True if ignored, False if explicitly not ignored (negated) and None if no rule matches"""
+        for match, negate, dir_only in reversed(self.rules):
+            if dir_only and not is_dir:
+                continue
+            if match(rel_path) is not None:
+                return not negate
+        return None
+
+
+class _Suggestions:
+    """Histograms of '.editorconfig' properties observed within files (see _observe) by file extension.
+    Histograms are merged as dicts, so they may be collected separately (e.g. by worker processes or shards)"""
+
+    PROPERTIES = ('indent_style', 'indent_size', 'charset', 'end_of_line', 'trim_trailing_whitespace')
+
+    def __init__(self):
+        self.histograms = {}    # File extension -> {'files': number of files, property: {value: number of files}}
+
+    def files(self, file_ext):
+        return self.histograms.get(file_ext, {}).get('files', 0)
+
+    def add(self, file_ext, observed):
+        histogram = self.histograms.setdefault(file_ext, {'files': 0})
+        histogram['files'] += 1
+        for name in self.PROPERTIES:
+            if name in observed:
+                values = histogram.setdefault(name, {})
+                values[observed[name]] = values.get(observed[name], 0) + 1
+
+    def to_dict(self):
+        return self.histograms
+
+    def merge(self, histograms):
+        for file_ext, other in histograms.items():
+            histogram = self.histograms.setdefault(file_ext, {'files': 0})
+            histogram['files'] += other['files']
+            for name in self.PROPERTIES:
+                if name in other:
+                    values = histogram.setdefault(name, {})
+                    for value, n in other[name].items():
+                        values[value] = values.get(value, 0) + n
+
+    def best(self, file_ext):
+        """Returns the most common value of each property"""
+        result = {}
+        for name in self.PROPERTIES:
+            values = self.histograms[file_ext].get(name)
+            if values:
+                result[name] = min(values, key=lambda value: (-values[value], value))
+        if result.get('indent_style') == 'tab':
+            result.pop('indent_size', None)
+        return result
+
+    def config_lines(self):
+        """Returns lines of '.editorconfig' with sections for files with extensions"""
+        lines = []
+        for file_ext in sorted(self.histograms):
+            if file_ext == '':
+                continue
+            best = self.best(file_ext)
+            if len(best) > 0:
+                lines.append("")
+                lines.append(f"[*.{file_ext}]")
+                lines.extend(f"{name} = {value}" for name, value in best.items())
+        return lines
+
+
+def _file_ext(file_name):
+    m = re.match(r'^.*?\.([^.]+)$', file_name)
+    if m is not None:
+        return m.groups()[0]
+    return ''
+
+
+def _ignored(ignore, path, is_dir):
+    """Checks path against rules of ignore files from the nearest one to the farthest one"""
+    for base, rules in reversed(ignore):
+        result = rules.match(os.path.relpath(path, base).replace(os.sep, "/"), is_dir)
+        if result is not None:
+            return result
+    return False
+
+
+def _scan_tree(path, matcher, ignore_files=None):
+    """Yields (root, ignore, names) for path and every folder within it in a stable order (same as os.walk does),
+    where ignore is a list of (folder, _IgnoreRules) of ignore files (like '.gitignore') applicable to root,
+    and names are sorted names of files within root that are neither hidden nor ignored.
+    Hidden folders, folders that are excluded by matcher (_PathMatcher) or ignored aren't entered at all"""
+
+    def scan(root, ignore):
+        try:
+            with os.scandir(root) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            return
+        if ignore_files is not None:
+            for name in ignore_files:
+                ignore_path = os.path.join(root, name)
+                if os.path.isfile(ignore_path):
+                    ignore = ignore + [(root, _IgnoreRules(ignore_path))]
+        dirs = []
+        names = []
+        for entry in entries:
+            if entry.name[:1] == ".":
+                continue
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                # NOTE: same as os.walk, symlinks to folders are neither entered nor processed
+                if not entry.is_symlink() and not matcher.skip_dir(entry.path) \
+                and not (len(ignore) > 0 and _ignored(ignore, entry.path, True)):
+                    dirs.append(entry.path)
+                continue
+            if len(ignore) > 0 and _ignored(ignore, entry.path, False):
+                continue
+            names.append(entry.name)
+        yield root, ignore, names
+        for d in dirs:
+            yield from scan(d, ignore)
+
+    yield from scan(path, [])
+
+
+def _walk(path, output_path, matcher, ignore_files=None):
+    """Yields (root, file_ext, file_path, output_file_path, skip) for every file within path in a stable order.
+    Hidden files and folders are skipped, folders that are excluded by matcher (_PathMatcher)
+    or by rules of ignore files (like '.gitignore') within walked tree aren't entered at all"""
+    for root, _, names in _scan_tree(path, matcher, ignore_files):
+        for name in names:
+            file_path = os.path.join(root, name)
+            fo = None
+            if output_path is not None:
+                fo = os.path.abspath(os.path.join(output_path, os.path.relpath(file_path, path)))
+            yield root, _file_ext(name), os.path.abspath(file_path), fo, matcher.skip(file_path)
+
+
+def _walk_list(files, path, output_path, matcher):
+    """Same as _walk, but for given list of files. Files outside of path, hidden files
+    and files within hidden folders are skipped silently"""
+    path_abs = os.path.abspath(path)
+    for file_path in files:
+        rel = os.path.relpath(os.path.abspath(file_path), path_abs)
+        parts = rel.split(os.sep)
+        if parts[0] == os.pardir or any(part[:1] == "." for part in parts):
+            continue
+        file_path = os.path.join(path, rel)
+        if not os.path.isfile(file_path):
+            continue
+        root, name = os.path.split(file_path)
+        fo = None
+        if output_path is not None:
+            fo = os.path.abspath(os.path.join(output_path, rel))
+        yield root, _file_ext(name), os.path.abspath(file_path), fo, matcher.skip(file_path)
+
+
+def _shard(walk, path, index, count):
+    """Yields entries of walk (see _walk) which belong to shard index of count shards. Walk is consumed at once.
+    Files are assigned the same way on any machine: the largest ones first (ties are ordered by hash of path
+    relative to path) to the least loaded shard, so shards are balanced by size and each file belongs to exactly
+    one of them. Skipped files are assigned by hash only. Entries are yielded in walk order"""
+    entries = list(walk)
+    path_abs = os.path.abspath(path)
+    keys = []
+    for _, _, file_path, _, skip in entries:
+        rel = os.path.relpath(file_path, path_abs).replace(os.sep, '/')
+        if skip:
+            size = None
+        else:
+            try:
+                # NOTE: each file costs something regardless of size, otherwise empty files would get into one shard
+                size = os.stat(file_path).st_size + 4096
+            except OSError:
+                size = 4096
+        keys.append((size, int.from_bytes(hashlib.blake2b(os.fsencode(rel), digest_size=8).digest(), 'big'), rel))
+    mine = [size is None and h % count == index for size, h, _ in keys]
+    loads = [(0, i) for i in range(count)]
+    sized = [i for i in range(len(entries)) if keys[i][0] is not None]
+    for i in sorted(sized, key=lambda i: (-keys[i][0], keys[i][1:])):
+        load, shard = loads[0]
+        mine[i] = shard == index
+        heapq.heapreplace(loads, (load + keys[i][0], shard))
+    for entry, m in zip(entries, mine):
+        if m:
+            yield entry
+
+
+def _git_changed_files(path, ref=None, staged=False):
+    """Returns sorted absolute paths of files within git repository containing path
+    which are added or modified since commit ref (including not committed and untracked ones)
+    or are added or modified within index if staged is True. Deleted files are not listed"""
+    directory = [os.path.dirname(os.path.abspath(path)), path][os.path.isdir(path)]
+
+    def git(*args):
+        try:
+            result = subprocess.run(['git', '-C', directory, *args], capture_output=True, check=True)
+        except FileNotFoundError:
+            raise ValueError("Git executable is not found!")
+        except subprocess.CalledProcessError as e:
+            raise ValueError(f"Git failed: {e.stderr.decode(errors='replace').strip()}")
+        return result.stdout
+
+    top = os.fsdecode(git('rev-parse', '--show-toplevel').rstrip(b'\r\n'))
+    if staged:
+        names = git('diff', '--cached', '--name-only', '--no-renames', '-z', '--diff-filter=d')
+    else:
+        names = git('diff', '--name-only', '--no-renames', '-z', '--diff-filter=d', ref, '--') \
+            + git('ls-files', '--others', '--exclude-standard', '-z', '--full-name')
+    return sorted({os.path.join(top, os.fsdecode(name)) for name in names.split(b'\x00') if len(name) > 0})
+
+
+def _read_file_list(source, nul=False):
+    """Returns paths listed within file source ('-' for stdin) one per line, or separated by NUL chars
+    if nul is True (e.g. output of 'find -print0'). Empty and repeated paths are omitted"""
+    if source == '-':
+        data = sys.stdin.buffer.read()
+    else:
+        try:
+            with open(source, "rb") as f:
+                data = f.read()
+        except OSError:
+            raise ValueError(f"File '{source}' not found!")
+    names = data.split(b'\x00') if nul else data.splitlines()
+    return list(dict.fromkeys(os.fsdecode(name) for name in names if len(name) > 0))
+
+
+_WORKER_OPTIONS = None
+_WORKER_PROFILE = False
+
+
+def _init_worker(options, profile):
+    global _WORKER_OPTIONS, _WORKER_PROFILE
+    _WORKER_OPTIONS = options
+    _WORKER_PROFILE = profile
+
+
+def _fix_indents_in_file_task(task, data=None, write=None):
+    """Process pool entry. Returns (result, error) so single failure doesn't break ordering of results.
+    Result contains 'seconds' spent to process file. If profiling is enabled, then result also contains
+    'stats' dict of file processing. data and write are passed to _fix_indents_in_file"""
+    file_path, output_path, properties, cache_digest = task
+    stats = None
+    if _WORKER_PROFILE:
+        stats = _Stats(top=1)
+    t = time.perf_counter()
+    try:
+        result = _fix_indents_in_file(
+            file_path, output_path, **_WORKER_OPTIONS, properties=properties, cache_digest=cache_digest,
+            stats=stats, data=data, write=write)
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+    result['seconds'] = time.perf_counter() - t
+    if stats is not None:
+        stats.file_done(file_path, result['seconds'])
+        result['stats'] = stats.to_dict()
+    return result, None
+
+
+def _read_ahead(iterable, depth):
+    """Yields items of iterable, which is consumed by separate thread up to depth items ahead"""
+    items = queue.Queue(depth)
+    done = object()
+
+    def produce():
+        try:
+            for item in iterable:
+                items.put((item, None))
+            items.put((done, None))
+        except BaseException as e:
+            items.put((done, e))
+
+    threading.Thread(target=produce, daemon=True).start()
+    while True:
+        item, error = items.get()
+        if item is done:
+            if error is not None:
+                raise error
+            return
+        yield item
+
+
+def _prefetch(task):
+    """Reads file of task in advance. Returns (content, os.stat_result) or None if file should be read
+    while it's processed (it's not covered by '.editorconfig', large or binary, or it has failed to read)"""
+    file_path, _, properties, _ = task
+    options = _WORKER_OPTIONS
+    if E_CONF is not None and not options['all_files'] and len(properties) == 0:
+        return None
+    try:
+        with open(file_path, "rb") as f:
+            st = os.fstat(f.fileno())
+            if not stat.S_ISREG(st.st_mode) or st.st_size > min(PREFETCH_SIZE, max(options['stream_threshold'], 0)):
+                return None
+            if options['sniff_binary'] and _sniff_binary(f, _resolve_encodings(properties, options['encodings'])[0]):
+                return None
+            return f.read(), st
+    except OSError:
+        return None
+
+
+def _run_pipelined(tasks, depth):
+    """Same as _fix_indents_in_file_task for every task, but tasks are taken from separate thread,
+    upcoming files are read in advance and results are written behind by pool of depth threads.
+    Yields (result, error) in order of tasks"""
+    with concurrent.futures.ThreadPoolExecutor(depth) as io:
+        tasks = _read_ahead(tasks, depth)
+        reads = deque()         # (task, future of prefetched content)
+        writes = deque()        # (result, error) that may wait for pending write
+        pending_size = 0
+
+        def write(output_path, data, mode_path):
+            nonlocal pending_size
+            pending_size += len(data)
+            return io.submit(_write_file, output_path, data, mode_path), len(data)
+
+        def finish(result, error):
+            nonlocal pending_size
+            if result is not None and 'pending' in result:
+                future, size = result.pop('pending')
+                pending_size -= size
+                try:
+                    future.result()
+                except Exception as e:
+                    return None, f"{type(e).__name__}: {e}"
+            return result, error
+
+        def ready(entry):
+            return entry[0] is None or 'pending' not in entry[0] or entry[0]['pending'][0].done()
+
+        while True:
+            while len(reads) < depth:
+                task = next(tasks, None)
+                if task is None:
+                    break
+                reads.append((task, io.submit(_prefetch, task)))
+            if len(reads) == 0:
                 break
+            task, data = reads.popleft()
+            writes.append(_fix_indents_in_file_task(task, data.result(), write))
+            while len(writes) > 0 and (len(writes) > depth or pending_size > WRITE_BEHIND_SIZE or ready(writes[0])):
+                yield finish(*writes.popleft())
+        while len(writes) > 0:
+            yield finish(*writes.popleft())
 
-    return skip
 
+def _run_tasks(tasks, options, jobs, profile=False, io_depth=0):
+    """Yields (result, error) for every task in order of tasks.
+    If single process is used and io_depth > 0, then I/O is pipelined (see _run_pipelined)"""
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    if jobs <= 1:
+        _init_worker(options, profile)
+        if io_depth > 0:
+            yield from _run_pipelined(tasks, io_depth)
+            return
+        for task in tasks:
+            yield _fix_indents_in_file_task(task)
+        return
+    with multiprocessing.Pool(jobs, initializer=_init_worker, initargs=(options, profile)) as pool:
+        # NOTE: imap keeps order of results, small chunks keep workers evenly loaded
+        yield from pool.imap(_fix_indents_in_file_task, tasks, chunksize=8)
 
-def _best_suggestions(vals):
-    return {}  # TODO: suggestions
+
+def _collect_result(report, file_path, result):
+    report[result['status']] += 1
+    if result['status'] == 'written':
+        report['written_files'].append(file_path)
+    if result['status'] != 'unformatted':
+        return
+    report['unformatted_files'].append((file_path, result.get('violation', "content differs")))
+    if 'diff' not in result:
+        return
+    if result['diff'] is None:
+        print(f"Diff of '{file_path}' is omitted: file is larger than stream threshold", file=sys.stderr)
+    else:
+        sys.stdout.write(result['diff'])
 
 
 def fix_indents_in_path(
         path, output_path=None, encodings=None, tab_width=None, use_tabs=None, trim=None, line_endings=None,
-        include=None, exclude=None, suggest=False, realign=False, all_files=False):
+        include=None, exclude=None, suggest=False, realign=False, all_files=False, jobs=1,
+        cache_path=None, cache_size=100000, stream_threshold=STREAM_THRESHOLD, profile=None, ignore_files=None,
+        sniff_binary=True, max_size=None, files=None, sample=None, sample_files=100, io_depth=0, check=False,
+        diff=False, on_result=None, shard=None):
+    """Returns report dict with numbers of processed files by status and list of (file_path, error) in walk order.
+    If check is True, then nothing is written, and badly formatted files ('unformatted' status) are listed
+    in report as (file_path, violation) in walk order ('unformatted_files').
+    If diff is True, then nothing is written either, and unified diff of badly formatted files is printed.
+    on_result(file_path, result, error) is called for every file in walk order as soon as it's processed,
+    result of file that isn't processed contains its status only ('skipped' for files excluded by include/exclude).
+    If shard (index, count) is specified, then only files of that shard are processed (see _shard), and missing
+    '.editorconfig' isn't filled-in with suggestions, since they have to be merged (see merge_reports) first.
+    Report contains 'shard' as [index, count] and list of 'written_files' in walk order.
+    If io_depth > 0 and files are processed by single process, then walk, reads of up to io_depth upcoming files
+    and writes of results are done by threads, so processing overlaps with I/O latency.
+    If suggest is True, then properties of files are observed (including files that aren't covered
+    by '.editorconfig'), report contains their histograms by file extension ('suggestions')
+    and missing '.editorconfig' within path is filled-in (or suggested config is printed if it exists).
+    If sample size (in bytes) is specified, then files aren't processed, only the first sample bytes
+    of up to sample_files files of each extension are read to observe properties.
+    If files are specified, then only those of them that are within path are processed, and path isn't walked.
+    ignore_files are names of '.gitignore'-like files, which rules are applied to the folder they are in.
+    Files that look like binary (if sniff_binary is True) or are larger than max_size are not processed
+    ('binary' status).
+    If cache_path is specified then files that are known to be well formatted are skipped ('cached' status).
+    Cache is used only when files are fixed in place.
+    If profile is specified (number of the slowest files to report), then report contains 'profile' dict
+    with time of processing phases, throughput counters and numbers of lines decoded with each encoding"""
+    if shard is None:
+        shard = (0, 1)
+    if not 0 <= shard[0] < shard[1]:
+        raise ValueError(f"Shard index {shard[0]} should be within [0, {shard[1]})!")
+    report = {'files': 0, 'written': 0, 'untouched': 0, 'cached': 0, 'ignored': 0, 'binary': 0, 'unformatted': 0,
+              'errors': [], 'written_files': [], 'unformatted_files': [], 'shard': list(shard)}
+    stats = None
+    if profile is not None:
+        stats = _Stats(profile)
+        started = time.perf_counter()
+
     if not os.path.exists(path):
         raise ValueError(f"Path {os.path.abspath(path)} doesn't exists!")
 
     if E_CONF is None:
         if not all_files:
             print("Editorconfig module is not loaded. Specify all_files (--all option) to proceed.", file=sys.stderr)
-            return
+            return report
 
-    if os.path.isdir(path):
-        fo = None
-        for root, _, files in os.walk(path):
-            suggestions = {}
-            if any(hp in root for hp in ("/.", "\\.")):
+    matcher = _PathMatcher(include, exclude)
+
+    options = {
+        'encodings'     : encodings,
+        'tab_width'     : tab_width,
+        'use_tabs'      : use_tabs,
+        'trim'          : trim,
+        'line_endings'  : line_endings,
+        'realign'       : realign,
+        'all_files'     : all_files,
+        'stream_threshold': stream_threshold,
+        'sniff_binary'  : sniff_binary,
+        'max_size'      : max_size,
+        'observe'       : suggest,
+        'check'         : check and not diff,
+        'diff'          : diff,
+    }
+    suggestions = None
+    if suggest:
+        suggestions = _Suggestions()
+
+    if os.path.isdir(path) and suggest and sample is not None:
+        resolver = _ConfigResolver()
+        if files is not None:
+            walk = _walk_list(files, path, None, matcher)
+        else:
+            walk = _walk(path, None, matcher, ignore_files)
+        if shard[1] > 1:
+            walk = _shard(walk, path, *shard)
+        for _, file_ext, file_path, _, skip in walk:
+            if skip or suggestions.files(file_ext) >= sample_files:
+                continue
+            report['files'] += 1
+            file_encodings, _ = _resolve_encodings(resolver.get_properties(file_path), encodings)
+            try:
+                with open(file_path, "rb") as f:
+                    observed = _observe_file(f, file_encodings, sample)
+            except Exception as e:
+                report['errors'].append((file_path, f"{type(e).__name__}: {e}"))
+                if on_result is not None:
+                    on_result(file_path, None, report['errors'][-1][1])
                 continue
-            for f in files:
-                if f[:1] == ".":
+            if observed is None:
+                report['binary'] += 1
+            else:
+                report['untouched'] += 1
+                suggestions.add(file_ext, observed)
+            if on_result is not None:
+                on_result(file_path, {'suggest': {}, 'status': ['untouched', 'binary'][observed is None]}, None)
+    elif os.path.isdir(path):
+        entries = []
+        cache = None
+        if cache_path is not None and output_path is None and not suggest:
+            cache = _Cache(cache_path, cache_size)
+        resolver = _ConfigResolver()
+        walk_stats = None
+        if stats is not None:
+            walk_stats = _Stats()
+
+        def tasks():
+            # NOTE: when running in pool, this generator is consumed by pool's thread,
+            #       so it only appends entries, and results are collected within main thread.
+            #       Entry's status is None if file is sent for processing
+            if files is not None:
+                walk = _walk_list(files, path, output_path, matcher)
+            else:
+                walk = _walk(path, output_path, matcher, ignore_files)
+            if shard[1] > 1:
+                walk = _shard(walk, path, *shard)
+            if walk_stats is not None:
+                walk = _timed(walk, walk_stats, 'walk')
+            for root, file_ext, file_path, fo, skip in walk:
+                if skip:
+                    entries.append((root, file_ext, file_path, 'skipped', None))
                     continue
-                m = re.match(r'^.*?\.([^.]+)$', f)
-                if m is not None:
-                    file_ext = m.groups()[0]
-                else:
-                    file_ext = ''
-                if file_ext not in suggestions:
-                    suggestions[file_ext] = []
-                if _skip(os.path.join(root, f), include, exclude):
-                    suggestions[file_ext].append({})
+                if walk_stats is not None:
+                    t = time.perf_counter()
+                properties = resolver.get_properties(file_path)
+                if walk_stats is not None:
+                    t = walk_stats.phase('config', t)
+                if E_CONF is not None and not all_files and len(properties) == 0 and not suggest:
+                    entries.append((root, file_ext, file_path, 'ignored', None))
+                    continue
+                if cache is None:
+                    entries.append((root, file_ext, file_path, None, None))
+                    yield file_path, fo, properties, None
+                    continue
+                try:
+                    st = os.stat(file_path)
+                except OSError:
+                    # NOTE: file is sent on without cache, so the error is reported as for other files
+                    entries.append((root, file_ext, file_path, None, None))
+                    yield file_path, fo, properties, None
                     continue
-                if output_path is not None:
-                    if root == path:
-                        fo = os.path.abspath(os.path.join(output_path, f))
-                    else:
-                        fo = os.path.abspath(os.path.join(output_path, root[len(path)+1:], f))
-                suggestions[file_ext].append(
-                    fix_indents_in_file(
-                        os.path.abspath(os.path.join(root, f)), fo, encodings, tab_width, use_tabs, trim, line_endings,
-                        realign, all_files)
-                )
-            if suggest:
-                ecp = os.path.join(root, '.editorconfig')
-                if os.path.exists(ecp):
-                    # TODO: update existing file
+                options_key = _Cache.options_key(options, properties)
+                cache_digest = cache.lookup(file_path, st, options_key)
+                if walk_stats is not None:
+                    walk_stats.phase('cache', t)
+                if cache_digest is True:
+                    entries.append((root, file_ext, file_path, 'cached', None))
                     continue
-                ecl = []
-                for k, v in suggestions.items():
-                    bs = _best_suggestions(v)
-                    if len(bs) > 0:
-                        ecl.append("")
-                        ecl.append(f"[*.{k}]")
-                        for pk, pv in bs.items():
-                            ecl.append(f"{pk} = {pv}")
-                if len(ecl) > 0:
-                    with open(ecp, "w", encoding='utf-8') as ecf:
-                        ecf.writelines(ecl)
+                entries.append((root, file_ext, file_path, None, options_key))
+                yield file_path, fo, properties, cache_digest
+
+        def collect_listed(entry):
+            if entry[3] != 'skipped':
+                report['files'] += 1
+                report[entry[3]] += 1
+            if on_result is not None:
+                on_result(entry[2], {'suggest': {}, 'status': entry[3]}, None)
+
+        ei = 0
+        try:
+            for result, error in _run_tasks(tasks(), options, jobs, stats is not None, io_depth):
+                while entries[ei][3] is not None:
+                    collect_listed(entries[ei])
+                    ei += 1
+                report['files'] += 1
+                if on_result is not None:
+                    on_result(entries[ei][2], result, error)
+                if error is not None:
+                    report['errors'].append((entries[ei][2], error))
+                else:
+                    _collect_result(report, entries[ei][2], result)
+                    if result.get('observed') is not None:
+                        suggestions.add(entries[ei][1], result['observed'])
+                    if stats is not None:
+                        stats.merge(result['stats'])
+                    if cache is not None and result['status'] == 'untouched' and result.get('cache') is not None:
+                        cache.store(entries[ei][2], result['cache'], entries[ei][4])
+                ei += 1
+            for entry in entries[ei:]:
+                collect_listed(entry)
+        finally:
+            if cache is not None:
+                cache.close()
+        if stats is not None:
+            stats.merge(walk_stats.to_dict())
+
     else:
         if not any(hp in path for hp in ("/.", "\\.")) \
-        and not _skip(path, include, exclude):
+        and (files is None or os.path.abspath(path) in map(os.path.abspath, files)) \
+        and not matcher.skip(path) and shard[0] == 0:
             if output_path is not None:
                 output_path = os.path.abspath(output_path)
-            fix_indents_in_file(os.path.abspath(path), output_path, encodings, tab_width, use_tabs, trim, line_endings)
+            report['files'] += 1
+            try:
+                t = time.perf_counter()
+                result = _fix_indents_in_file(
+                    os.path.abspath(path), output_path, encodings, tab_width, use_tabs, trim, line_endings,
+                    realign, all_files, stream_threshold=stream_threshold, stats=stats,
+                    sniff_binary=sniff_binary, max_size=max_size, check=check and not diff, diff=diff)
+                result['seconds'] = time.perf_counter() - t
+                _collect_result(report, os.path.abspath(path), result)
+                if stats is not None:
+                    stats.file_done(os.path.abspath(path), result['seconds'])
+                if on_result is not None:
+                    on_result(os.path.abspath(path), result, None)
+            except Exception as e:
+                report['errors'].append((os.path.abspath(path), f"{type(e).__name__}: {e}"))
+                if on_result is not None:
+                    on_result(os.path.abspath(path), None, report['errors'][-1][1])
+
+    if suggestions is not None and os.path.isdir(path):
+        report['suggestions'] = suggestions.to_dict()
+        ecl = [] if shard[1] > 1 else suggestions.config_lines()
+        ecp = os.path.join(path, '.editorconfig')
+        if len(ecl) > 0:
+            ecl[0] = "# Suggested by unifile.py according to existing files"
+            if os.path.exists(ecp):
+                # NOTE: stdout may carry diff or JSON records
+                print(f"File '{ecp}' already exists. Suggested config:", file=sys.stderr)
+                print("\n".join(ecl), file=sys.stderr)
+            else:
+                with open(ecp, "w", encoding='utf-8') as ecf:
+                    ecf.write("\n".join(ecl) + "\n")
+
+    for file_path, error in report['errors']:
+        print(f"Failed to process '{file_path}': {error}", file=sys.stderr)
+
+    if stats is not None:
+        report['profile'] = stats.to_dict()
+        report['profile']['seconds'] = time.perf_counter() - started
+        report['profile']['files_per_second'] = report['files'] / max(report['profile']['seconds'], 1e-9)
+
+    return report
+
+
+def merge_reports(reports):
+    """Returns report merged from reports of fix_indents_in_path for all shards (in any order).
+    Numbers of files are summed, lists of files and errors are concatenated and sorted by path,
+    suggestions and profiles are merged (total time is the time of the slowest shard).
+    Raises ValueError if reports don't cover each shard exactly once"""
+    if len(reports) == 0:
+        raise ValueError("There are no reports to merge!")
+    count = reports[0].get('shard', [0, 1])[1]
+    indexes = sorted(report.get('shard', [0, 1])[0] for report in reports)
+    if any(report.get('shard', [0, 1])[1] != count for report in reports) or indexes != list(range(count)):
+        raise ValueError(f"Reports should be of shards 1..{count} each: {', '.join(str(i + 1) for i in indexes)}")
+    merged = {'shard': [0, 1]}
+    suggestions = None
+    stats = None
+    seconds = 0.0
+    for report in reports:
+        for key, value in report.items():
+            if key == 'shard':
+                continue
+            if key == 'suggestions':
+                if suggestions is None:
+                    suggestions = _Suggestions()
+                suggestions.merge(value)
+            elif key == 'profile':
+                if stats is None:
+                    stats = _Stats(max(len(r.get('profile', {}).get('slowest', [])) for r in reports))
+                stats.merge(value)
+                seconds = max(seconds, value['seconds'])
+            elif isinstance(value, list):
+                merged.setdefault(key, []).extend(value)
+            else:
+                merged[key] = merged.get(key, 0) + value
+    for key, value in merged.items():
+        if key != 'shard' and isinstance(value, list):
+            value.sort(key=lambda item: item if isinstance(item, str) else item[0])
+    if suggestions is not None:
+        merged['suggestions'] = suggestions.to_dict()
+    if stats is not None:
+        merged['profile'] = stats.to_dict()
+        merged['profile']['seconds'] = seconds
+        merged['profile']['files_per_second'] = merged['files'] / max(seconds, 1e-9)
+    return merged
+
+
+class _Inotify:
+    """Watches folders with Linux inotify. Raises OSError if inotify isn't available"""
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+    EVENT = struct.Struct("iIII")
+
+    def __init__(self):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is available on Linux only")
+        libc = ctypes.CDLL(None, use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = (ctypes.c_int, ctypes.c_int)
+        self.fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dirs = {}     # Watch descriptor -> folder
+
+    def add(self, directory):
+        wd = self._add_watch(self.fd, os.fsencode(directory), self.MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"Failed to watch '{directory}'")
+        self._dirs[wd] = directory
+
+    def remove(self, directory):
+        for wd, d in list(self._dirs.items()):
+            if d == directory or d.startswith(os.path.join(directory, "")):
+                self._rm_watch(self.fd, wd)
+                del self._dirs[wd]
+
+    def wait(self, timeout):
+        """Returns list of (path, is_dir, gone) of changes, or None if events were lost"""
+        if len(select.select([self.fd], [], [], timeout)[0]) == 0:
+            return []
+        changes = []
+        overflow = False
+        while True:
+            try:
+                data = os.read(self.fd, 1 << 16)
+            except BlockingIOError:
+                break
+            pos = 0
+            while pos < len(data):
+                wd, mask, _, size = self.EVENT.unpack_from(data, pos)
+                name = data[pos + self.EVENT.size:pos + self.EVENT.size + size].rstrip(b'\x00')
+                pos += self.EVENT.size + size
+                if mask & self.IN_Q_OVERFLOW:
+                    overflow = True
+                    continue
+                if mask & self.IN_IGNORED:
+                    self._dirs.pop(wd, None)
+                    continue
+                directory = self._dirs.get(wd)
+                if directory is None or len(name) == 0:
+                    continue
+                gone = mask & (self.IN_MOVED_FROM | self.IN_DELETE) != 0
+                changes.append((os.path.join(directory, os.fsdecode(name)), mask & self.IN_ISDIR != 0, gone))
+        if overflow:
+            return None
+        return changes
+
+    def close(self):
+        os.close(self.fd)
+
+
+class _Poller:
+    """Watches folders by comparing stats of files on every wait"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._dirs = {}     # Folder -> {name: (mtime_ns, size)}
+        self._seen = set()  # Folders that are already reported
+
+    @staticmethod
+    def _snapshot(directory):
+        files = {}
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    try:
+                        if entry.is_file():
+                            st = entry.stat()
+                            files[entry.name] = (st.st_mtime_ns, st.st_size)
+                    except OSError:
+                        pass
+        except OSError:
+            return None
+        return files
+
+    def add(self, directory):
+        self._dirs[directory] = self._snapshot(directory) or {}
+        self._seen.add(directory)
+
+    def remove(self, directory):
+        for d in list(self._dirs):
+            if d == directory or d.startswith(os.path.join(directory, "")):
+                del self._dirs[d]
+        self._seen = {d for d in self._seen if d != directory and not d.startswith(os.path.join(directory, ""))}
+
+    def wait(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        changes = []
+        for directory, files in list(self._dirs.items()):
+            current = self._snapshot(directory)
+            if current is None:
+                changes.append((directory, True, True))
+                continue
+            for name, sig in current.items():
+                if files.get(name) != sig:
+                    changes.append((os.path.join(directory, name), False, False))
+            for name in files.keys() - current.keys():
+                changes.append((os.path.join(directory, name), False, True))
+            self._dirs[directory] = current
+        # NOTE: new folders are found on the next rescan of the parent one
+        for directory in list(self._dirs):
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False) and entry.path not in self._seen:
+                            self._seen.add(entry.path)
+                            changes.append((entry.path, True, False))
+            except OSError:
+                pass
+        return changes
+
+    def close(self):
+        pass
+
+
+def watch_path(
+        path, encodings=None, tab_width=None, use_tabs=None, trim=None, line_endings=None,
+        include=None, exclude=None, realign=False, all_files=False, ignore_files=None,
+        stream_threshold=STREAM_THRESHOLD, sniff_binary=True, max_size=None,
+        debounce=0.2, poll=None, stop=None, on_result=None):
+    """Watches folder and fixes files in place as they are changed, until KeyboardInterrupt or until stop
+    (threading.Event) is set. Changes are collected until there are no new ones for debounce seconds.
+    Uses inotify on Linux, otherwise (or if poll interval in seconds is specified) polls stats of files.
+    Parsed '.editorconfig' files are kept in memory and reloaded when they change.
+    Files that are written by watcher itself are not processed again.
+    on_result(file_path, result, error) is called for every processed file"""
+    if not os.path.isdir(path):
+        raise ValueError(f"Path {os.path.abspath(path)} should point to folder!")
+    options = {
+        'encodings'     : encodings,
+        'tab_width'     : tab_width,
+        'use_tabs'      : use_tabs,
+        'trim'          : trim,
+        'line_endings'  : line_endings,
+        'realign'       : realign,
+        'all_files'     : all_files,
+        'stream_threshold': stream_threshold,
+        'sniff_binary'  : sniff_binary,
+        'max_size'      : max_size,
+    }
+    matcher = _PathMatcher(include, exclude)
+    resolver = _ConfigResolver()
+    ignores = {}    # Watched folder -> rules of ignore files applicable to it
+    written = {}    # File path -> (mtime_ns, size, inode) of file written by watcher
+
+    watcher = None
+    if poll is None:
+        try:
+            watcher = _Inotify()
+        except (OSError, AttributeError):
+            pass
+    if watcher is None:
+        watcher = _Poller(poll or 1.0)
+
+    def add_tree(directory):
+        """Watches directory and folders within it, returns paths of files within them"""
+        found = []
+        parent = os.path.dirname(directory)
+        if directory != path:
+            if os.path.basename(directory)[:1] == "." or parent not in ignores or matcher.skip_dir(directory):
+                return found
+            if len(ignores[parent]) > 0 and _ignored(ignores[parent], directory, True):
+                return found
+        # NOTE: ignore files of parent folders are applied as well
+        for root, ignore, names in _scan_tree(directory, matcher, ignore_files):
+            ignore = ignores.get(parent, []) + ignore
+            try:
+                watcher.add(root)
+            except OSError as e:
+                print(f"Failed to watch '{root}': {e}", file=sys.stderr)
+                continue
+            ignores[root] = ignore
+            found.extend(os.path.join(root, name) for name in names)
+        return found
+
+    def process(file_path):
+        if not os.path.isfile(file_path):
+            return
+        try:
+            st = os.stat(file_path)
+            if written.pop(file_path, None) == (st.st_mtime_ns, st.st_size, st.st_ino):
+                return
+            properties = resolver.get_properties(os.path.abspath(file_path))
+            if E_CONF is not None and not all_files and len(properties) == 0:
+                return
+            result = _fix_indents_in_file(os.path.abspath(file_path), None, **options, properties=properties)
+        except Exception as e:
+            if on_result is not None:
+                on_result(file_path, None, f"{type(e).__name__}: {e}")
+            return
+        if result['status'] == 'written':
+            st = os.stat(file_path)
+            written[file_path] = (st.st_mtime_ns, st.st_size, st.st_ino)
+        if on_result is not None:
+            on_result(file_path, result, None)
+
+    add_tree(path)
+    pending = {}    # Path -> is_dir
+    deadline = None
+    try:
+        while stop is None or not stop.is_set():
+            changes = watcher.wait(debounce if len(pending) > 0 else 1.0)
+            if changes is None:
+                print("Some of file system events are lost, folder is rescanned", file=sys.stderr)
+                watcher.remove(path)
+                ignores.clear()
+                resolver = _ConfigResolver()
+                add_tree(path)
+                continue
+            for change_path, is_dir, gone in changes:
+                if gone:
+                    pending.pop(change_path, None)
+                    if is_dir or change_path in ignores:
+                        watcher.remove(change_path)
+                        for d in [d for d in ignores if d == change_path or d.startswith(change_path + os.sep)]:
+                            del ignores[d]
+                    if os.path.basename(change_path) == '.editorconfig':
+                        resolver.invalidate()
+                    continue
+                pending[change_path] = is_dir
+                deadline = time.monotonic() + debounce
+            if len(pending) == 0 or time.monotonic() < deadline:
+                continue
+            batch = pending
+            pending = {}
+            files = []
+            for change_path, is_dir in batch.items():
+                name = os.path.basename(change_path)
+                if name == '.editorconfig':
+                    resolver.invalidate()
+                elif is_dir:
+                    if change_path not in ignores:
+                        files.extend(add_tree(change_path))
+                elif name[:1] != "." and os.path.dirname(change_path) in ignores:
+                    ignore = ignores[os.path.dirname(change_path)]
+                    if not matcher.skip(change_path) and not (len(ignore) > 0 and _ignored(ignore, change_path, False)):
+                        files.append(change_path)
+            for file_path in sorted(set(files)):
+                process(file_path)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+
+_FRAME_HEADER = struct.Struct(">I")
+
+
+def _read_frame(f):
+    """Returns payload of frame (4 bytes big-endian length, then payload) or None in the end of stream"""
+    header = f.read(_FRAME_HEADER.size)
+    if len(header) == 0:
+        return None
+    if len(header) < _FRAME_HEADER.size:
+        raise ValueError("Truncated frame header!")
+    size = _FRAME_HEADER.unpack(header)[0]
+    payload = f.read(size)
+    if len(payload) < size:
+        raise ValueError("Truncated frame!")
+    return payload
+
+
+def _write_frame(f, payload):
+    f.write(_FRAME_HEADER.pack(len(payload)))
+    f.write(payload)
 
 
-if __name__ == "__main__":
+def serve(fin, fout):
+    """Formats content with format_bytes on requests from binary stream fin until it ends, results are written
+    into binary stream fout in order of requests. Each request and result is a JSON object, which is framed
+    as 4 bytes big-endian length followed by UTF-8 JSON.
+    Request: {"id": any, "path": path hint, "options": format_bytes options, "data": base64 content}
+    or {"id": any, "op": "reset"} to forget parsed '.editorconfig' files.
+    Result: {"id": any, "data": base64 content, "changed": bool, "suggest": dict} or {"id": any, "error": str}"""
+    while True:
+        payload = _read_frame(fin)
+        if payload is None:
+            return
+        request_id = None
+        try:
+            request = json.loads(payload)
+            request_id = request.get('id')
+            if request.get('op') == 'reset':
+                reset_config_cache()
+                result = {'id': request_id}
+            else:
+                data = base64.b64decode(request['data'], validate=True)
+                o_data, suggest = format_bytes(data, path_hint=request.get('path'), options=request.get('options'))
+                result = {
+                    'id'        : request_id,
+                    'data'      : base64.b64encode(o_data).decode('ascii'),
+                    'changed'   : o_data != data,
+                    'suggest'   : suggest,
+                }
+        except Exception as e:
+            result = {'id': request_id, 'error': f"{type(e).__name__}: {e}"}
+        _write_frame(fout, json.dumps(result).encode('utf-8'))
+        fout.flush()
+
+
+def _print_summary(report, check=False, quiet=False, file=sys.stdout):
+    if check:
+        for file_path, violation in report['unformatted_files']:
+            print(f"{file_path}: {violation}", file=file)
+    if quiet:
+        return
+    print(f"Processed {report['files']} file(s): {report['written']} written, {report['untouched']} untouched"
+          f", {report['unformatted']} badly formatted"
+          f", {report['cached']} known to be well formatted"
+          f", {report['ignored']} not covered by '.editorconfig', {report['binary']} binary"
+          f", {len(report['errors'])} failed", file=file)
+
+
+def _print_profile(profile, file=sys.stderr):
+    print(f"Total time: {profile['seconds']:.3f} s, {profile['files_per_second']:.1f} files/s", file=file)
+    phases_time = sum(profile['phases'].values())
+    print("Phases (cumulative time over all workers):", file=file)
+    for name, seconds in sorted(profile['phases'].items(), key=lambda kv: -kv[1]):
+        print(f"  {name:<10} {seconds:>10.3f} s {seconds / max(phases_time, 1e-9) * 100:>6.1f}%", file=file)
+    print("Counters:", file=file)
+    for name, value in sorted(profile['counters'].items()):
+        print(f"  {name:<13} {value}", file=file)
+    if len(profile['encoding_index']) > 0:
+        print("Lines decoded with encodings (by position within list of encodings):", file=file)
+        for eid, n in sorted(profile['encoding_index'].items()):
+            print(f"  #{eid + 1:<3} {n}", file=file)
+        for encoding, n in sorted(profile['encodings'].items()):
+            print(f"  {encoding:<13} {n}", file=file)
+    if len(profile['slowest']) > 0:
+        print("Slowest files:", file=file)
+        for seconds, file_path in profile['slowest']:
+            print(f"  {seconds:>10.3f} s {file_path}", file=file)
+
+
+if __name__ == "__main__" and sys.argv[1:2] == ['merge-reports']:
+    parser = argparse.ArgumentParser(
+        prog = "python unifile.py merge-reports",
+        description= "Merge reports of shards (see --shard and --report-json) into one summary."
+                     " Exit status is non-zero if there are failed or badly formatted files.")
+    parser.add_argument('reports', nargs='+', help='Report JSON files of all shards')
+    parser.add_argument('--report-json', required=False, dest='report_json', default=None,
+                        help='Save merged report into JSON file')
+    parser.add_argument('--check', required=False, dest='check', action='store_true',
+                        help='List badly formatted files with the first violation')
+    parser.add_argument('--stats', required=False, dest='stats', action='store_true',
+                        help='Print merged time of processing phases, throughput and the slowest files')
+    parser.add_argument('-q', '--quiet', required=False, dest='quiet', action='store_true',
+                        help='Don\'t print summary')
+    args = parser.parse_args(sys.argv[2:])
+    reports = []
+    for report_path in args.reports:
+        try:
+            with open(report_path, "r", encoding='utf-8') as f:
+                reports.append(json.load(f))
+        except (OSError, ValueError) as e:
+            parser.error(f"can't read report '{report_path}': {e}")
+    try:
+        report = merge_reports(reports)
+    except ValueError as e:
+        parser.error(str(e))
+    for file_path, error in report['errors']:
+        print(f"Failed to process '{file_path}': {error}", file=sys.stderr)
+    if 'suggestions' in report:
+        suggestions = _Suggestions()
+        suggestions.merge(report['suggestions'])
+        ecl = suggestions.config_lines()
+        if len(ecl) > 0:
+            ecl[0] = "# Suggested by unifile.py according to existing files"
+            print("Suggested config:")
+            print("\n".join(ecl))
+    if args.stats and 'profile' in report:
+        _print_profile(report['profile'])
+    if args.report_json is not None:
+        with open(args.report_json, "w", encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    _print_summary(report, args.check, args.quiet)
+    if len(report['errors']) > 0 or report['unformatted'] > 0:
+        sys.exit(1)
+elif __name__ == "__main__":
     parser = argparse.ArgumentParser(
         prog = "python unifile.py",
         description= "Fix indentation chars in file or files within path according to specified rules,"
@@ -501,7 +2802,7 @@ if __name__ == "__main__":
         epilog = "That's all, folks!",
     )
 
-    parser.add_argument('path', help='Path to file or folder to fix')
+    parser.add_argument('path', nargs='?', default=None, help='Path to file or folder to fix')
     parser.add_argument('-o', '--output', required=False, dest='output_path', default=None,
                         help='Output path. If omitted then result is saved in place')
     parser.add_argument('-s', '--tab-size', required=False, dest='tab_width', type=int, default=None,
@@ -521,6 +2822,9 @@ if __name__ == "__main__":
                             f' Fallbacks to {", ".join(ENCODINGS)}')
     parser.add_argument('-r', '--realign', required=False, dest='realign', action='store_true',
                         help='Realign text so it start on tab-stops.')
+    parser.add_argument('--realign-columns', required=False, dest='realign_columns', action='store_true',
+                        help='Realign text like --realign and also align columns of text'
+                             ' within blocks of adjacent lines with the same indent and number of columns')
     parser.add_argument('-a', '--all', required=False, dest='all_files', action='store_true',
                         help='By default scripts processes only files'
                              ' that are mentioned in editorconfig. This option enforces to process all files.'
@@ -534,22 +2838,205 @@ if __name__ == "__main__":
     parser.add_argument('-x', '--exclude', required=False, dest='exclude', action='append', default=None,
                         help='Pattern to exclude files from processing. Multiple patterns may be provided.'
                              ' If omitted then no files excluded (except \'hidden\').'
-                             ' If specified then takes precedence over include')
+                             ' If specified then takes precedence over include.'
+                             ' Folders which paths with trailing separator match pattern aren\'t entered at all')
+    parser.add_argument('--ignore-file', required=False, dest='ignore_files', action='append', default=None,
+                        help='Name of \'.gitignore\'-like file with patterns of files and folders to skip.'
+                             ' Patterns are applied to the folder containing the file and to its subfolders.'
+                             ' Multiple names may be provided, e.g. \'--ignore-file .gitignore\'')
+    parser.add_argument('--changed-since', required=False, dest='changed_since', default=None,
+                        help='Process only files within path that are added or modified since specified git commit'
+                             ' (including not committed and untracked files)')
+    parser.add_argument('--staged', required=False, dest='staged', action='store_true',
+                        help='Process only files within path that are added or modified within git index')
+    parser.add_argument('--files-from', required=False, dest='files_from', default=None,
+                        help='Process only files listed within file (\'-\' for stdin) one per line, path isn\'t walked.'
+                             ' If path isn\'t specified, then it\'s the common folder of listed files')
+    parser.add_argument('-0', '--null', required=False, dest='null', action='store_true',
+                        help='Files listed by --files-from are separated by NUL chars (e.g. output of find -print0)')
+    parser.add_argument('-w', '--watch', required=False, dest='watch', action='store_true',
+                        help='Keep running and fix files within folder in place as soon as they are changed.'
+                             ' Only changed files are processed')
+    parser.add_argument('--debounce', required=False, dest='debounce', type=int, default=200,
+                        help='Time (in ms) without changes to wait before processing of changed files in watch mode.'
+                             ' Default is 200 ms')
+    parser.add_argument('--poll', required=False, dest='poll', type=float, default=None,
+                        help='Poll files for changes with specified interval (in seconds) in watch mode'
+                             ' instead of using inotify (which is available on Linux only)')
+    parser.add_argument('--server', required=False, dest='server', action='store_true',
+                        help='Format content on requests from stdin and write results into stdout.'
+                             ' Requests and results are JSON objects framed as 4 bytes big-endian length'
+                             ' followed by JSON. See serve() for format')
+    parser.add_argument('--check', required=False, dest='check', action='store_true',
+                        help='Don\'t write anything, only list badly formatted files with the first violation'
+                             ' and exit with status 1 if there are any')
+    parser.add_argument('--diff', required=False, dest='diff', action='store_true',
+                        help='Don\'t write anything, print unified diff of badly formatted files instead'
+                             ' and exit with status 1 if there are any. Diff of files larger than --stream-threshold'
+                             ' isn\'t printed, they are only named in a notice on stderr')
+    parser.add_argument('--jsonl', required=False, dest='jsonl', action='store_true',
+                        help='Print JSON record per file as soon as it\'s processed: path, status, encoding,'
+                             ' suggestions and seconds spent (or error)')
     parser.add_argument('--suggest-config', required=False, dest='suggest', action='store_true',
-                        help="TODO: Fill-in missing '.editorconfig' file according to existing files (on per-folder basis)")
+                        help="Fill-in missing '.editorconfig' file within specified folder according to existing files"
+                             " (including files that aren't covered by '.editorconfig'). If it exists,"
+                             " then suggested config is printed. Files are still processed unless --suggest-sample"
+                             " is specified")
+    parser.add_argument('--suggest-sample', required=False, dest='sample', type=int, default=None,
+                        help='Don\'t process files with --suggest-config, only read the first specified number'
+                             ' of KB of files to observe their properties')
+    parser.add_argument('--suggest-files', required=False, dest='sample_files', type=int, default=100,
+                        help='Max number of files of each extension to read with --suggest-sample. Default is 100')
+    parser.add_argument('-j', '--jobs', required=False, dest='jobs', type=int, default=None,
+                        help='Number of worker processes to process files within folder.'
+                             ' Fallbacks to number of CPUs')
+    parser.add_argument('--cache', required=False, dest='cache', action='store_true',
+                        help='Use persistent cache to skip files that are known to be well formatted.'
+                             ' Cache is used only when files are fixed in place')
+    parser.add_argument('--cache-file', required=False, dest='cache_path', default=None,
+                        help='Cache file path (implies --cache).'
+                             ' Fallbacks to \'.unifile-cache\' within specified folder')
+    parser.add_argument('--cache-size', required=False, dest='cache_size', type=int, default=100000,
+                        help='Max number of entries in cache. Least recently used entries are evicted. Default is 100000')
+    parser.add_argument('--stream-threshold', required=False, dest='stream_threshold', type=int,
+                        default=STREAM_THRESHOLD >> 20,
+                        help='Files larger than this size (in MB) are processed line by line'
+                             f' without loading them into memory. Default is {STREAM_THRESHOLD >> 20} MB')
+    parser.add_argument('--no-binary-check', required=False, dest='sniff_binary', action='store_false',
+                        help='Don\'t check files for binary content.'
+                             ' By default files with NUL bytes, many control chars or signatures of common binary'
+                             ' formats within the first few KB are skipped')
+    parser.add_argument('--max-size', required=False, dest='max_size', type=int, default=None,
+                        help='Skip files larger than this size (in KB) as binary')
+    parser.add_argument('--io-depth', required=False, dest='io_depth', type=int, default=8,
+                        help='Number of files to read in advance and results to write behind by threads'
+                             ' when files are processed by single process (--jobs 1),'
+                             ' which is useful on network file systems. 0 disables it. Default is 8')
+    parser.add_argument('--stats', required=False, dest='stats', action='store_true',
+                        help='Print time of processing phases, throughput and the slowest files')
+    parser.add_argument('--shard', required=False, dest='shard', default=None,
+                        help='Process only shard I of N (I/N, e.g. 1/4) of files. Files are assigned to shards'
+                             ' the same way on any machine and balanced by size. Reports of all shards'
+                             ' (--report-json) are combined by merge-reports command, e.g.'
+                             ' python unifile.py merge-reports shard-*.json')
+    parser.add_argument('--report-json', required=False, dest='report_json', default=None,
+                        help='Save report (numbers of files by status, written, badly formatted and failed files,'
+                             ' suggestions, profile) into JSON file')
+    parser.add_argument('--profile-json', required=False, dest='profile_json', default=None,
+                        help='Save time of processing phases, throughput and the slowest files into JSON file')
+    parser.add_argument('--stats-top', required=False, dest='stats_top', type=int, default=10,
+                        help='Number of the slowest files to report. Default is 10')
+    parser.add_argument('-q', '--quiet', required=False, dest='quiet', action='store_true',
+                        help='Don\'t print summary in the end of run')
     parser.add_argument('--version', action='version', version='Unifile v. '+VERSION)
     args = parser.parse_args()
-    fix_indents_in_path(
+    if args.server:
+        serve(sys.stdin.buffer, sys.stdout.buffer)
+        sys.exit(0)
+    if args.path is None and args.files_from is None:
+        parser.error("the following arguments are required: path")
+    if sum((args.changed_since is not None, args.staged, args.files_from is not None)) > 1:
+        parser.error("--changed-since, --staged and --files-from are mutually exclusive")
+    if args.watch and (args.check or args.diff or args.jsonl or args.files_from is not None):
+        parser.error("--check, --diff, --jsonl and --files-from can't be used with --watch")
+    if args.jsonl and args.diff:
+        parser.error("--jsonl and --diff are mutually exclusive")
+    shard = None
+    if args.shard is not None:
+        m = re.fullmatch(r'(\d+)/(\d+)', args.shard)
+        if m is None or not 1 <= int(m.group(1)) <= int(m.group(2)):
+            parser.error("--shard should be I/N, where 1 <= I <= N")
+        if args.watch:
+            parser.error("--shard can't be used with --watch")
+        shard = (int(m.group(1)) - 1, int(m.group(2)))
+    if args.watch:
+        def on_result(file_path, result, error):
+            if error is not None:
+                print(f"Failed to process '{file_path}': {error}", file=sys.stderr)
+            elif result['status'] == 'written' and not args.quiet:
+                print(f"Fixed '{file_path}'")
+        watch_path(
+            args.path,
+            args.encodings,
+            args.tab_width,
+            [args.indent_char == 'tab', None][args.indent_char == 'auto'],
+            [args.trim == 'true', None][args.trim == 'auto'],
+            [args.line_endings, None][args.line_endings == 'auto'],
+            args.include,
+            args.exclude,
+            [args.realign, REALIGN_COLUMNS][args.realign_columns],
+            args.all_files,
+            args.ignore_files,
+            args.stream_threshold << 20,
+            args.sniff_binary,
+            None if args.max_size is None else args.max_size << 10,
+            args.debounce / 1000,
+            args.poll,
+            on_result=on_result,
+        )
+        sys.exit(0)
+    files = None
+    if args.changed_since is not None or args.staged:
+        files = _git_changed_files(args.path, args.changed_since, args.staged)
+    if args.files_from is not None:
+        files = _read_file_list(args.files_from, args.null)
+        if args.path is None:
+            args.path = os.path.commonpath([os.path.abspath(f) for f in files]) if len(files) > 0 else os.curdir
+            if not os.path.isdir(args.path):
+                args.path = os.path.dirname(args.path)
+    on_result = None
+    if args.jsonl:
+        def on_result(file_path, result, error):
+            if error is not None:
+                record = {'path': file_path, 'status': 'error', 'error': error}
+            else:
+                record = {'path': file_path, 'status': result['status'], 'encoding': result.get('encoding'),
+                          'suggest': result['suggest'], 'seconds': result.get('seconds')}
+                if 'violation' in result:
+                    record['violation'] = result['violation']
+            print(json.dumps(record), flush=True)
+    if args.cache and args.cache_path is None:
+        args.cache_path = os.path.join(
+            [os.path.dirname(args.path), args.path][os.path.isdir(args.path)], '.unifile-cache')
+    report = fix_indents_in_path(
         args.path,
-        args.output_path,
-        args.encodings,
-        args.tab_width,
-        [args.indent_char == 'tab', None][args.indent_char == 'auto'],
-        [args.trim == 'true', None][args.trim == 'auto'],
-        [args.line_endings, None][args.line_endings == 'auto'],
-        args.include,
-        args.exclude,
-        args.suggest,
-        args.realign,
-        args.all_files,
+        output_path=args.output_path,
+        encodings=args.encodings,
+        tab_width=args.tab_width,
+        use_tabs=[args.indent_char == 'tab', None][args.indent_char == 'auto'],
+        trim=[args.trim == 'true', None][args.trim == 'auto'],
+        line_endings=[args.line_endings, None][args.line_endings == 'auto'],
+        include=args.include,
+        exclude=args.exclude,
+        suggest=args.suggest,
+        realign=[args.realign, REALIGN_COLUMNS][args.realign_columns],
+        all_files=args.all_files,
+        jobs=args.jobs,
+        cache_path=args.cache_path,
+        cache_size=args.cache_size,
+        stream_threshold=args.stream_threshold << 20,
+        profile=[None, args.stats_top][args.stats or args.profile_json is not None],
+        ignore_files=args.ignore_files,
+        sniff_binary=args.sniff_binary,
+        max_size=None if args.max_size is None else args.max_size << 10,
+        files=files,
+        sample=None if args.sample is None else args.sample << 10,
+        sample_files=args.sample_files,
+        io_depth=args.io_depth,
+        check=args.check,
+        diff=args.diff,
+        on_result=on_result,
+        shard=shard,
     )
+    if args.stats:
+        _print_profile(report['profile'])
+    if args.profile_json is not None:
+        with open(args.profile_json, "w", encoding='utf-8') as f:
+            json.dump(report['profile'], f, indent=2)
+    # NOTE: diff and JSON records are printed to stdout, so they can be consumed by other tools
+    if args.report_json is not None:
+        with open(args.report_json, "w", encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    _print_summary(report, args.check and not args.jsonl, args.quiet, [sys.stdout, sys.stderr][args.diff or args.jsonl])
+    if len(report['errors']) > 0 or report['unformatted'] > 0:
+        sys.exit(1)
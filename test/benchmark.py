@@ -0,0 +1,298 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import unifile
+
+
+ENCODINGS = ('utf-8', 'windows-1251')
+_WORDS = (
+    "if", "else", "begin", "end", "assign", "x", "y0", "value", "(a,", "b)", "{", "}", ";", "//", "#",
+    "=", "<=", "0x1F", "\"str\"", "фыва", "проверка", "данные",
+)
+_INDENTS = ("", "\t", "\t\t", "    ", "        ", "  ", " \t", "\t  ", "   \t")
+_GAPS = (" ", " ", " ", "  ", "\t", "\t\t", "    ", " \t ")
+_TRAILS = ("", "", "", " ", "\t", "  \t ")
+_LINE_BREAKS = ("\n", "\n", "\r\n", "\r")
+# File within generated corpus, only folders with it are removed when corpus is regenerated
+CORPUS_MARKER = ".unifile-corpus"
+_STYLES = (
+    ("indent_style = space", "indent_size = 4"),
+    ("indent_style = tab", "indent_size = 4"),
+    ("indent_style = space", "indent_size = 2"),
+    ("indent_style = tab", "indent_size = 8"),
+)
+
+
+def _sample(size, line_break=b"\n"):
+    """Synthetic text of given size with indents, mixed whitespaces and non-ascii chars"""
+    pattern = line_break.join([
+        b"\tif (x) {  ",
+        b"        call(a,\tb);",
+        b"\t  \xd1\x84\xd1\x8b\xd0\xb2 text   \t",
+        b"",
+        b"    }",
+    ]) + line_break
+    return pattern * (size // len(pattern)) + b"x" * (size % len(pattern))
+
+
+def _random_line(rnd, words=8):
+    line = rnd.choice(_INDENTS)
+    for i in range(rnd.randint(0, words)):
+        if i > 0:
+            line += rnd.choice(_GAPS)
+        line += rnd.choice(_WORDS)
+    return line + rnd.choice(_TRAILS)
+
+
+def _random_text(rnd, size, words=8):
+    """Returns raw text of about given size with random line break and mixed utf-8/windows-1251 lines"""
+    line_break = rnd.choice(_LINE_BREAKS)
+    mixed = rnd.random() < 0.3
+    chunks = []
+    total = 0
+    while total < size:
+        line = _random_line(rnd, words) + line_break
+        encoding = ENCODINGS[mixed and rnd.random() < 0.2]
+        chunks.append(line.encode(encoding))
+        total += len(chunks[-1])
+    return b"".join(chunks)
+
+
+def generate_corpus(path, seed=0, scale=1):
+    """Generates reproducible tree of files with '.editorconfig' hierarchy.
+    Returns list of generated files"""
+    rnd = random.Random(seed)
+    files = []
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, CORPUS_MARKER), "w", encoding='utf-8') as f:
+        f.write(f"Generated by benchmark.py with seed {seed} and scale {scale}\n")
+
+    def write(file_path, data):
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, "wb") as f:
+            f.write(data)
+        files.append(file_path)
+
+    def tree(directory, depth):
+        os.makedirs(directory, exist_ok=True)
+        if depth == 0 or rnd.random() < 0.5:
+            ecl = ["root = true", ""] if depth == 0 else []
+            for ext in ("c", "py", "v", "txt"):
+                ecl.append(f"[*.{ext}]")
+                ecl.extend(rnd.choice(_STYLES))
+                ecl.append(f"trim_trailing_whitespace = {rnd.choice(('true', 'false'))}")
+                if rnd.random() < 0.3:
+                    ecl.append(f"end_of_line = {rnd.choice(('lf', 'crlf'))}")
+                ecl.append("")
+            with open(os.path.join(directory, ".editorconfig"), "w", encoding='utf-8') as f:
+                f.write("\n".join(ecl))
+        for i in range(8):
+            ext = rnd.choice(("c", "py", "v", "txt"))
+            write(os.path.join(directory, f"file{i}.{ext}"), _random_text(rnd, rnd.randint(256, 16 << 10) * scale))
+        if depth < 3:
+            for i in range(3):
+                tree(os.path.join(directory, f"dir{i}"), depth + 1)
+
+    tree(path, 0)
+    write(os.path.join(path, "long", "long-lines.txt"), _random_text(rnd, (1 << 20) * scale, words=2000))
+    write(os.path.join(path, "huge", "huge.txt"), _random_text(rnd, (8 << 20) * scale))
+    return files
+
+
+def _timeit(func, repeat):
+    best = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        func()
+        t = time.perf_counter() - t
+        if best is None or t < best:
+            best = t
+    return best
+
+
+def _sample_lines(files, count):
+    """Returns decoded lines (without line breaks) of files"""
+    lines = []
+    for file_path in files:
+        with open(file_path, "rb") as f:
+            lines.extend(unifile._read_lines(f.read(), ENCODINGS)[0])
+        if len(lines) >= count:
+            break
+    return lines[:count]
+
+
+def bench_suite(corpus, files, repeat):
+    """Times each processing stage separately. Returns {name: {'seconds': ..., 'bytes': ...}}"""
+    results = {}
+
+    def bench(name, func, size):
+        results[name] = {'seconds': _timeit(func, repeat), 'bytes': size}
+        print(f"{name:>32} {results[name]['seconds']:>10.4f} s", file=sys.stderr)
+
+    small_files = [f for f in files if os.path.getsize(f) < (1 << 20)]
+    lines = _sample_lines(small_files, 50000)
+    size = sum(len(l) for l in lines)
+    for name, func, use_tabs in (
+            ('fix_spaces', unifile.fix_spaces, False),
+            ('fix_tabs', unifile.fix_tabs, True),
+            ('_fix_spaces_fast', unifile._fix_spaces_fast, False),
+            ('_fix_tabs_fast', unifile._fix_tabs_fast, True)):
+        bench(name, lambda: [func(l, 4, True) for l in lines], size)
+
+    realign_lines = [unifile._fix_tabs_fast(l, 4, True) for l in lines]
+    size = sum(len(l) for l in realign_lines)
+    bench('realign_text', lambda: [unifile.realign_text(l, True, 4) for l in realign_lines], size)
+
+    def realign_columns():
+        aligner = unifile._ColumnAligner(True, 4)
+        aligner.feed(realign_lines)
+        aligner.finish()
+
+    bench('realign_columns', realign_columns, size)
+
+    with tempfile.TemporaryDirectory() as output:
+        # NOTE: each repeat writes into fresh folder, so no run finds output of the previous one
+        def fix_files(file_list):
+            target = tempfile.mkdtemp(dir=output)
+            for i, file_path in enumerate(file_list):
+                unifile.fix_indents_in_file(
+                    file_path, os.path.join(target, str(i)), ENCODINGS, all_files=True)
+
+        bench('fix_indents_in_file', lambda: fix_files(small_files), sum(os.path.getsize(f) for f in small_files))
+        huge = [f for f in files if f not in small_files]
+        bench('fix_indents_in_file:large', lambda: fix_files(huge), sum(os.path.getsize(f) for f in huge))
+
+        total = sum(os.path.getsize(f) for f in files)
+        for jobs in sorted({1, os.cpu_count() or 1}):
+            bench(f'fix_indents_in_path:jobs={jobs}',
+                  lambda: unifile.fix_indents_in_path(
+                      corpus, tempfile.mkdtemp(dir=output), ENCODINGS, jobs=jobs),
+                  total)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Returns names of benchmarks that are slower than in baseline by more than threshold percents"""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result['seconds'] / max(baseline[name]['seconds'], 1e-9)
+        print(f"{name:>32} {ratio:>8.2f}x", file=sys.stderr)
+        if ratio > 1 + threshold / 100:
+            regressions.append(name)
+    return regressions
+
+
+def bench_scaling(min_size, max_size):
+    """Time of reading (splitting and decoding) and of full file processing for growing input sizes.
+    Time per byte should stay the same for linear implementation"""
+    results = []
+    size = min_size
+    with tempfile.TemporaryDirectory() as tmp:
+        while size <= max_size:
+            fb = _sample(size)
+            repeat = max(1, min(20, (1 << 24) // size))
+            read_time = _timeit(lambda: unifile._read_lines(fb, ('utf-8', )), repeat)
+            file_path = os.path.join(tmp, "sample.txt")
+            output_path = os.path.join(tmp, "output.txt")
+            with open(file_path, "wb") as f:
+                f.write(fb)
+            del fb
+            file_time = _timeit(
+                lambda: unifile._fix_indents_in_file(file_path, output_path, all_files=True), repeat)
+            results.append((size, read_time, file_time))
+            size *= 16
+    return results
+
+
+def _size_str(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size} {unit}"
+        size //= 1024
+    return f"{size} TB"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog = "python benchmark.py",
+        description= "Benchmarks of unifile.py. By default generates synthetic corpus and times processing stages",
+    )
+    parser.add_argument('--corpus', required=False, dest='corpus', default=None,
+                        help='Folder for generated corpus. It\'s kept after run. Existing folder is replaced only'
+                             ' if it\'s empty or previously generated corpus. If omitted then temporary folder is used')
+    parser.add_argument('--seed', required=False, dest='seed', type=int, default=0,
+                        help='Corpus random seed. Default is 0')
+    parser.add_argument('--scale', required=False, dest='scale', type=int, default=1,
+                        help='Corpus files size multiplier. Default is 1')
+    parser.add_argument('--repeat', required=False, dest='repeat', type=int, default=3,
+                        help='Number of runs of each benchmark, the best one is taken. Default is 3')
+    parser.add_argument('--json', required=False, dest='json_path', default=None,
+                        help='Save results as JSON')
+    parser.add_argument('--baseline', required=False, dest='baseline', default=None,
+                        help='JSON results of previous run to compare with.'
+                             ' Exit code is non-zero if anything is slower by more than threshold')
+    parser.add_argument('--threshold', required=False, dest='threshold', type=float, default=10,
+                        help='Allowed slowdown in percents. Default is 10')
+    parser.add_argument('--scaling', required=False, dest='scaling', action='store_true',
+                        help='Check linear scaling of reading and processing of single file instead')
+    parser.add_argument('--min-size', required=False, dest='min_size', type=int, default=1024,
+                        help='Min input size in bytes for --scaling. Default is 1 KB')
+    parser.add_argument('--max-size', required=False, dest='max_size', type=int, default=64 << 20,
+                        help='Max input size in bytes for --scaling (use 1073741824 for 1 GB). Default is 64 MB')
+    args = parser.parse_args()
+
+    if args.scaling:
+        print(f"{'size':>10} {'read, s':>10} {'ns/byte':>8} {'file, s':>10} {'ns/byte':>8}")
+        for size, read_time, file_time in bench_scaling(args.min_size, args.max_size):
+            print(f"{_size_str(size):>10} {read_time:>10.4f} {read_time / size * 1e9:>8.1f}"
+                  f" {file_time:>10.4f} {file_time / size * 1e9:>8.1f}")
+        sys.exit(0)
+
+    corpus = args.corpus
+    if corpus is None:
+        corpus = tempfile.mkdtemp(prefix="unifile-corpus-")
+    elif os.path.exists(corpus):
+        if not os.path.isdir(corpus):
+            parser.error(f"--corpus '{corpus}' isn't a folder")
+        if os.path.isfile(os.path.join(corpus, CORPUS_MARKER)):
+            shutil.rmtree(corpus)
+        elif len(os.listdir(corpus)) > 0:
+            parser.error(f"--corpus '{corpus}' isn't empty and wasn't generated by benchmark.py, it's kept as is")
+    try:
+        files = generate_corpus(corpus, args.seed, args.scale)
+        results = {
+            'version'   : unifile.VERSION,
+            'python'    : platform.python_version(),
+            'cpus'      : os.cpu_count(),
+            'seed'      : args.seed,
+            'scale'     : args.scale,
+            'results'   : bench_suite(corpus, files, args.repeat),
+        }
+    finally:
+        if args.corpus is None:
+            shutil.rmtree(corpus)
+
+    output = json.dumps(results, indent=2)
+    if args.json_path is not None:
+        with open(args.json_path, "w", encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.baseline is not None:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results['results'], baseline['results'], args.threshold)
+        if len(regressions) > 0:
+            print(f"Regressions above {args.threshold}%: {', '.join(regressions)}", file=sys.stderr)
+            sys.exit(1)
@@ -0,0 +1,109 @@
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import unifile
+
+
+# Differential fuzzing of fast whitespaces processing against reference implementation
+_PAIRS = (
+    (unifile.fix_spaces, unifile._fix_spaces_fast),
+    (unifile.fix_tabs, unifile._fix_tabs_fast),
+)
+_CHARS = (" ", " ", " ", "\t", "\t", "a", "b", "ф", "\f")
+
+
+def _random_line(rnd):
+    line = "".join(rnd.choice(_CHARS) for _ in range(rnd.randint(0, 24)))
+    if rnd.random() < 0.1:
+        # Stray line break chars within line
+        pos = rnd.randint(0, len(line))
+        line = line[:pos] + rnd.choice(("\r", "\n")) + line[pos:]
+    if rnd.random() < 0.2:
+        # Terminated lines as they come from other callers
+        line += rnd.choice(("\n", "\r\n", "\r"))
+    return line
+
+
+def fuzz(iterations, seed):
+    rnd = random.Random(seed)
+    failures = 0
+    for _ in range(iterations):
+        line = _random_line(rnd)
+        tab_width = rnd.randint(1, 9)
+        trim = rnd.random() < 0.5
+        for reference, fast in _PAIRS:
+            expected = reference(line, tab_width, trim)
+            actual = fast(line, tab_width, trim)
+            if expected != actual:
+                failures += 1
+                print(f"{fast.__name__}({line!r}, {tab_width}, {trim}): {actual!r} != {expected!r}")
+    return failures
+
+
+def _reference_content(fb, encodings, use_tabs, tab_width, trim, realign):
+    """Formats content line by line with reference implementation, columns are aligned by _ColumnAligner"""
+    lines, encoding_index, line_break, no_last_line_break = unifile._read_lines(fb, encodings)
+    if len(fb) == 0:
+        return b''
+    fix = [unifile.fix_spaces, unifile.fix_tabs][use_tabs]
+    result = [fix(l, tab_width, trim) for l in lines]
+    if realign == unifile.REALIGN_COLUMNS:
+        aligner = unifile._ColumnAligner(use_tabs, tab_width)
+        result = aligner.feed(result) + aligner.finish()
+    elif realign:
+        result = [unifile.realign_text(l, use_tabs, tab_width) for l in result]
+    text = line_break.join(result)
+    if not no_last_line_break:
+        text += line_break
+    return text.encode(encodings[encoding_index])
+
+
+def fuzz_content(iterations, seed):
+    """Checks formatting of whole content (including processing without decoding and realign)
+    against reference implementation"""
+    rnd = random.Random(seed)
+    failures = 0
+    for _ in range(iterations):
+        line_break = rnd.choice(("\n", "\r\n", "\r"))
+        text = line_break.join(_random_line(rnd).rstrip("\r\n") for _ in range(rnd.randint(0, 6)))
+        if rnd.random() < 0.5:
+            text += line_break
+        encodings = rnd.choice((("utf-8", "windows-1251"), ("windows-1251",), ("latin-1",)))
+        fb = text.encode(encodings[0], errors='replace')
+        use_tabs = rnd.random() < 0.5
+        tab_width = rnd.randint(1, 9)
+        trim = rnd.random() < 0.5
+        for realign in (False, True, unifile.REALIGN_COLUMNS):
+            expected = _reference_content(fb, encodings, use_tabs, tab_width, trim, realign)
+            try:
+                actual = unifile._format_content(
+                    fb, {}, encodings, None, tab_width, use_tabs, trim, None, realign, {})
+            except Exception as e:
+                actual = f"{type(e).__name__}: {e}"
+            if expected != actual:
+                failures += 1
+                print(f"_format_content({fb!r}, {use_tabs}, {tab_width}, {trim}, {realign}):"
+                      f" {actual!r} != {expected!r}")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog = "python fuzz_whitespace.py",
+        description= "Checks that fast whitespaces processing gives the same result as reference implementation",
+    )
+    parser.add_argument('-n', '--iterations', required=False, dest='iterations', type=int, default=200000,
+                        help='Number of random lines. Default is 200000')
+    parser.add_argument('--seed', required=False, dest='seed', type=int, default=0,
+                        help='Random seed. Default is 0')
+    args = parser.parse_args()
+    failures = fuzz(args.iterations, args.seed)
+    print(f"{args.iterations} lines checked, {failures} mismatches")
+    content_failures = fuzz_content(args.iterations // 10, args.seed)
+    print(f"{args.iterations // 10} contents checked (with realign), {content_failures} mismatches")
+    failures += content_failures
+    if failures > 0:
+        sys.exit(1)
@@ -0,0 +1,6 @@
+#!/bin/bash
+
+# Process .txt files in two shards with stats, then merge their reports
+python ../src/unifile.py -o ../.out-s -e "utf-8" -e "windows-1251" -i ".*?\\.txt\$" --stats --shard 1/2 --report-json ../.out-s-1.json . &&
+python ../src/unifile.py -o ../.out-s -e "utf-8" -e "windows-1251" -i ".*?\\.txt\$" --stats --shard 2/2 --report-json ../.out-s-2.json . &&
+python ../src/unifile.py merge-reports --stats ../.out-s-1.json ../.out-s-2.json